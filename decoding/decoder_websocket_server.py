@@ -18,9 +18,9 @@ Functions:
 
 # %% ---- 2023-08-14 ------------------------
 # Requirements and constants
-import io
 import cv2
 import time
+import json
 import asyncio
 import numpy as np
 
@@ -29,6 +29,7 @@ from loguru import logger as LOGGER
 from websockets.server import serve
 
 from predict_model.Predict import predict
+from wire_format import decode, decode_header, MAX_FRAME_SIZE
 
 # %% ---- 2023-08-14 ------------------------
 # Function and class
@@ -40,6 +41,10 @@ async def echo(websocket):
     Args:
         websocket (websocket income connection): The websocket connection requesting for decoding results.
 
+    Request rule:
+        The frame of the wire format, the eeg_data, stm32_data and face_img_in_bgr arrays in order,
+        several requests are in flight on the connection.
+
     Message rule:
         Numbers no-less than 0, refers the decoding result is correct;
         -1 refers the stm32_data shape is incorrect;
@@ -47,16 +52,26 @@ async def echo(websocket):
         other string refers the runtime error of the predict function.
 
     Returns:
-        Send the response back.
+        Send the response back, the json of {id, message}.
     """
     async for message in websocket:
-        # Create the io container
-        io_recv = io.BytesIO(message)
+        # The request without the valid header can not be replied
+        try:
+            request_id = decode_header(message)['request_id']
+        except Exception as err:
+            LOGGER.error(f'Invalid request: {err}')
+            continue
+
+        # Parse the data in-order, the arrays are the read-only views of the message
+        try:
+            header, (eeg_data, stm32_data, face_img_in_bgr) = decode(message)
+        except Exception as err:
+            LOGGER.error(f'Invalid request {request_id}: {err}')
+            await websocket.send(json.dumps(dict(id=request_id, message=f'{err}')))
+            continue
 
-        # Parse the data in-order
-        eeg_data = np.load(io_recv)
-        stm32_data = np.load(io_recv)
-        face_img_in_bgr = np.load(io_recv)
+        LOGGER.debug(
+            f'Request {request_id} arrives in {(time.time_ns() - header["sent_ns"]) / 1e6:.2f} ms')
 
         # !!! Fix the issue of the current stm32 sampling rate
         stm32_data = np.concatenate([stm32_data for _ in range(100)], axis=1)
@@ -65,27 +80,30 @@ async def echo(websocket):
         face_img_in_bgr = cv2.resize(face_img_in_bgr, (2048, 1088))
         face_img_in_bgr = cv2.cvtColor(face_img_in_bgr, cv2.COLOR_BGR2RGB)
 
-        # Basic check
+        # Basic check, the connection is kept for the next requests
         if stm32_data.shape[1] != 1000:
-            return -1
+            message = -1
 
-        if eeg_data.shape[1] != 1000:
-            return -2
+        elif eeg_data.shape[1] != 1000:
+            message = -2
 
-        LOGGER.debug(
-            f'Data for decoding: {stm32_data.shape}, {eeg_data.shape}, {face_img_in_bgr.shape}')
+        else:
+            LOGGER.debug(
+                f'Data for decoding: {stm32_data.shape}, {eeg_data.shape}, {face_img_in_bgr.shape}')
 
-        try:
-            message = predict(stm32_data, eeg_data, face_img_in_bgr)
-        except Exception as err:
-            message = err
-            LOGGER.error(f'Decoding failed: {err}')
+            # The predict runs in the thread, so the connection keeps alive in the decoding
+            try:
+                message = await asyncio.to_thread(predict, stm32_data, eeg_data, face_img_in_bgr)
+            except Exception as err:
+                message = err
+                LOGGER.error(f'Decoding failed: {err}')
 
-        await websocket.send(f'{message}')
+        await websocket.send(json.dumps(dict(id=request_id, message=f'{message}')))
 
 
 async def serve_forever():
-    async with serve(echo, "localhost", 8765):
+    # The default max_size of 1 MiB is smaller than the request of the raw face image
+    async with serve(echo, "localhost", 8765, max_size=MAX_FRAME_SIZE):
         LOGGER.debug('Serving forever ...')
         await asyncio.Future()  # run forever
 
@@ -0,0 +1,263 @@
+"""
+File: wire_format.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Binary wire format of the decoding requests
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+
+Format:
+    The request is a single frame in little-endian,
+    the header, the descriptors of the arrays, and the buffers of the arrays.
+    Every part starts at the multiple of 8 bytes, so the arrays are decoded in place.
+
+    Header (32 bytes):
+        magic (4s), version (H), number of the arrays (H),
+        request id (q), sent time in time.time_ns() (q), capture time in the sender's host clock (q).
+
+    Descriptor (32 bytes, one for each array):
+        codec (B), dtype (B), ndim (B), pad (x), nbytes of the buffer (Q),
+        shape (4I), pad (4x).
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import cv2
+import time
+import struct
+
+import numpy as np
+
+MAGIC = b'VFVS'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHHqqq')
+DESCRIPTOR = struct.Struct('<BBBxQ4I4x')
+MAX_NDIM = 4
+ALIGNMENT = 8
+
+# The max bytes of the request frame, it is the max_size of the websocket server,
+# it holds the raw 1920 x 1080 face image with the float64 eeg and stm32 windows
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+# The codecs of the arrays,
+# the float16 array is converted back into float32 in the decoding,
+# the jpeg array is the uint8 image of height x width x 3.
+CODECS = ['raw', 'float16', 'jpeg']
+
+DTYPES = [np.dtype(e) for e in ['uint8', 'int8', 'uint16', 'int16', 'int32', 'int64',
+                                'float16', 'float32', 'float64']]
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+def aligned(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def encode(request_id, arrays, codecs=None, capture_ns=0, jpeg_quality=90):
+    """Encode the arrays into the request frame.
+
+    Args:
+        request_id (int): The request id;
+        arrays (list): The np.array being sent in order;
+        codecs (list, optional): The codec of every array, 'raw', 'float16' or 'jpeg'. Defaults to None, refers all 'raw';
+        capture_ns (int, optional): The capture time of the data in the sender's host clock. Defaults to 0;
+        jpeg_quality (int, optional): The quality of the jpeg, 0 ~ 100. Defaults to 90.
+
+    Returns:
+        bytearray: The request frame.
+    """
+    if codecs is None:
+        codecs = ['raw' for _ in arrays]
+
+    if len(codecs) != len(arrays):
+        raise ValueError(
+            f'Every array requires its codec: {len(codecs)} != {len(arrays)}')
+
+    # The parts are (codec, dtype, shape, nbytes, source),
+    # the source is the array being copied into the frame, or the jpeg buffer
+    parts = []
+    for array, codec in zip(arrays, codecs):
+        array = np.asarray(array)
+        shape = array.shape
+
+        if array.ndim > MAX_NDIM:
+            raise ValueError(f'Too many dimensions: {shape}')
+
+        if codec == 'raw':
+            dtype = array.dtype
+            source = array
+
+        elif codec == 'float16':
+            dtype = np.dtype(np.float16)
+            source = array
+
+        elif codec == 'jpeg':
+            dtype = array.dtype
+            success_flag, source = cv2.imencode(
+                '.jpg', array, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            if not success_flag:
+                raise ValueError(f'Failed to encode the jpeg: {shape}')
+
+        else:
+            raise ValueError(f'Invalid codec: {codec}')
+
+        if dtype not in DTYPES:
+            raise ValueError(f'Unsupported dtype: {dtype}')
+
+        nbytes = source.nbytes if codec == 'jpeg' else array.size * dtype.itemsize
+        parts.append((codec, dtype, shape, nbytes, source))
+
+    size = HEADER.size + DESCRIPTOR.size * len(parts)
+    size += sum(aligned(nbytes) for *_, nbytes, _ in parts)
+
+    # The larger frame is refused by the server, and it closes the connection
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'Too large frame: {size} > {MAX_FRAME_SIZE} bytes')
+
+    frame = bytearray(size)
+    view = memoryview(frame)
+
+    HEADER.pack_into(view, 0, MAGIC, VERSION, len(parts),
+                     request_id, time.time_ns(), capture_ns)
+
+    offset = HEADER.size
+    for codec, dtype, shape, nbytes, _ in parts:
+        padded_shape = tuple(shape) + (0, ) * (MAX_NDIM - len(shape))
+        DESCRIPTOR.pack_into(view, offset, CODECS.index(codec), DTYPES.index(dtype),
+                             len(shape), nbytes, *padded_shape)
+        offset += DESCRIPTOR.size
+
+    # The array is copied into the frame only once, even if it is not contiguous
+    for codec, dtype, shape, nbytes, source in parts:
+        buffer = view[offset:offset+nbytes]
+        if codec == 'jpeg':
+            buffer[:] = memoryview(source).cast('B')
+        else:
+            np.copyto(np.frombuffer(buffer, dtype=dtype).reshape(shape),
+                      source, casting='same_kind')
+        offset += aligned(nbytes)
+
+    return frame
+
+
+def decode_header(frame):
+    """Decode the header of the request frame,
+    the request id is known even if the arrays are broken.
+
+    Args:
+        frame (bytes): The request frame.
+
+    Raises:
+        ValueError: The header is not in the format.
+
+    Returns:
+        dict: The header, the keys are version, request_id, sent_ns, capture_ns and n, the number of the arrays.
+    """
+    view = memoryview(frame)
+
+    if len(view) < HEADER.size:
+        raise ValueError(f'Too short frame: {len(view)} bytes')
+
+    magic, version, n, request_id, sent_ns, capture_ns = HEADER.unpack_from(
+        view, 0)
+
+    if magic != MAGIC:
+        raise ValueError(f'Invalid magic: {magic}')
+
+    if version != VERSION:
+        raise ValueError(f'Unsupported version: {version}')
+
+    return dict(version=version,
+                request_id=request_id,
+                sent_ns=sent_ns,
+                capture_ns=capture_ns,
+                n=n)
+
+
+def decode(frame):
+    """Decode the request frame,
+    the raw arrays are the read-only views of the frame without copying.
+
+    Args:
+        frame (bytes): The request frame.
+
+    Raises:
+        ValueError: The frame is not in the format.
+
+    Returns:
+        dict: The header, see decode_header;
+        list: The arrays.
+    """
+    header = decode_header(frame)
+    view = memoryview(frame)
+    n = header['n']
+
+    offset = HEADER.size + DESCRIPTOR.size * n
+    if offset > len(view):
+        raise ValueError(f'Truncated descriptors: {len(view)} bytes')
+
+    descriptors = [DESCRIPTOR.unpack_from(view, HEADER.size + j * DESCRIPTOR.size)
+                   for j in range(n)]
+
+    arrays = []
+    for codec, dtype, ndim, nbytes, *padded_shape in descriptors:
+        if codec >= len(CODECS) or dtype >= len(DTYPES) or ndim > MAX_NDIM:
+            raise ValueError(
+                f'Invalid descriptor: codec={codec}, dtype={dtype}, ndim={ndim}')
+
+        if offset + nbytes > len(view):
+            raise ValueError(f'Truncated frame: {len(view)} bytes')
+
+        shape = tuple(padded_shape[:ndim])
+        buffer = view[offset:offset+nbytes]
+        offset += aligned(nbytes)
+
+        if CODECS[codec] == 'jpeg':
+            array = cv2.imdecode(np.frombuffer(
+                buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+            if array is None:
+                raise ValueError(f'Failed to decode the jpeg: {shape}')
+
+            if array.shape != shape:
+                raise ValueError(
+                    f'Mismatched jpeg: {array.shape} != {shape}')
+
+        else:
+            if nbytes != np.prod(shape, dtype=np.int64) * DTYPES[dtype].itemsize:
+                raise ValueError(
+                    f'Mismatched buffer: {nbytes} bytes for {shape} {DTYPES[dtype]}')
+
+            array = np.frombuffer(buffer, dtype=DTYPES[dtype]).reshape(shape)
+
+        if CODECS[codec] == 'float16':
+            array = array.astype(np.float32)
+
+        arrays.append(array)
+
+    return header, arrays
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
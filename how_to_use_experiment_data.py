@@ -48,10 +48,19 @@ print(f'Selected path: {selected_path}')
 # Pending
 data = joblib.load(selected_path)
 print('----------------------------------------------------------------')
-print('Data explain, it is a dict with two keys:')
+print('Data explain, it is a dict with three keys:')
 
 for key, value in data.items():
     print('-' * 8)
+
+    # The columns of the packages or frames, see Stm32DeviceReader.peek_latest_data_by_length,
+    # the video_seq of the stm32_data refers the seq of the video_data
+    if isinstance(value, dict):
+        print(f'{key}:\t{type(value)}, columns={len(value)}')
+        for k, v in value.items():
+            print(f'{k}:\t({type(v)}),\t{v.dtype},\t{v.shape}')
+        continue
+
     print(
         f'{key}:\t{type(value)}, length={len(value)}, elementType={type(value[0])}')
 
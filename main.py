@@ -19,11 +19,11 @@ Functions:
 # %% ---- 2023-07-20 ------------------------
 # Requirements and constants
 
-import cv2
 import time
 import joblib
 import keyboard
 import threading
+import multiprocessing
 
 import numpy as np
 
@@ -33,9 +33,12 @@ from pathlib import Path
 # from util.eeg_device_reader import EEGDeviceReader
 from util.eeg_device_reader_simulation import EEGDeviceReader
 from util.stm32_device_reader import Stm32DeviceReader
-from util.video_capture_device_reader import VideoCaptureReader
+from util.video_capture_device_reader import VideoCaptureReader, VideoFrameBuffer
 from util.comprehensive_decoder import ComprehensiveDecoder
 from util.main_window import MainWindow
+from util.display_process import DisplayProcess
+from util.display_sinks import new_display_sink
+from util.control_server import ControlServer
 from util.toolbox import uint8, put_text, timestamp2milliseconds, delay2fps
 from util import LOGGER, CONF
 
@@ -43,6 +46,7 @@ from util import LOGGER, CONF
 
 project_name = CONF['project_name']
 quite_key_code = CONF['keyboard']['quite_key_code']
+headless = CONF['display']['headless']
 
 
 # %% ---- 2023-07-20 ------------------------
@@ -78,58 +82,81 @@ def keypress_callback(key):
 
     LOGGER.debug(f'Keypress {key}, {key.name}')
 
-    if key.name == quite_key_code:
+    command_callback(key.name)
+
+    return
+
+
+def command_callback(command):
+    """Callback function for the commands,
+    they are the keys being pressed, or the lines from the control server.
+
+    Args:
+        command (str): The command, like the name of the key.
+    """
+
+    if command == quite_key_code:
         LOGGER.debug('Quite key code is received.')
         running_option.stop()
 
-    if key.name == '=':
+    if command == '=':
         CONF['video']['display_height'] += 10
         video_capture_reader.conf_override()
 
-    if key.name == '-':
+    if command == '-':
         CONF['video']['display_height'] -= 10
         video_capture_reader.conf_override()
 
     return
 
 
-# %% ---- 2023-07-20 ------------------------
-# Play ground
-# Initialize the workers
-video_capture_reader = VideoCaptureReader()
+def peek_aligned_data(end_ns, timeout=0.5):
+    """Peek the stm32 and eeg data of the windows ending at the same host time,
+    it waits for the packages that have not arrived.
+
+    Args:
+        end_ns (int): The aligned host time of the windows' end, see ClockSync;
+        timeout (float, optional): The seconds to wait for the packages. Defaults to 0.5.
 
-eeg_device_reader = EEGDeviceReader()
-eeg_device_reader.start()
+    Returns:
+        tuple: The stm32_data and eeg_data, None if it is not available.
+    """
+    deadline = time.time() + timeout
 
-stm32_device_reader = Stm32DeviceReader(video_capture_reader)
-stm32_device_reader.start()
+    while True:
+        stm32_data = stm32_device_reader.peek_latest_data_by_milliseconds(
+            comprehensive_decoder.stm32_data_length, end_ns=end_ns)
 
-comprehensive_decoder = ComprehensiveDecoder()
+        eeg_data = eeg_device_reader.peek_latest_data_by_milliseconds(
+            comprehensive_decoder.eeg_data_length, end_ns=end_ns)
 
-main_window = MainWindow()
+        if (stm32_data is not None and eeg_data is not None) or time.time() > deadline:
+            return stm32_data, eeg_data
 
-# %%
+        time.sleep(0.01)
 
 
 def set_time_interval_job(secs=0):
     time.sleep(secs)
 
-    stm32_data = stm32_device_reader.peek_latest_data_by_milliseconds(
-        comprehensive_decoder.stm32_data_length)
+    # The windows are co-registered at the capture time of the video frame
+    # The decoder requires the untouched frame
+    _, video_timestamp_ns, video_image = video_capture_reader.read_raw_frame()
+
+    stm32_data, eeg_data = peek_aligned_data(video_timestamp_ns)
+
     if stm32_data is not None:
         print(f'stm32_data: {stm32_data.shape}')
 
-    eeg_data = eeg_device_reader.peek_latest_data_by_milliseconds(
-        comprehensive_decoder.eeg_data_length)
     if eeg_data is not None:
         print(f'eeg_data: {eeg_data.shape}')
 
-    video_image = video_capture_reader.read()
-
+    # The result is drawn when it is received, so the predictions are pipelined
     if not any([stm32_data is None, eeg_data is None]):
-        comprehensive_decoder.predict(stm32_data,
-                                      eeg_data,
-                                      video_image)
+        comprehensive_decoder.submit(stm32_data,
+                                     eeg_data,
+                                     video_image,
+                                     capture_ns=video_timestamp_ns)
 
     return
 
@@ -142,17 +169,50 @@ def loop_prediction(secs=1):
         #     target=set_time_interval_job, daemon=True).start()
 
 
-threading.Thread(target=loop_prediction, args=(1, ), daemon=True).start()
+# %% ---- 2023-07-20 ------------------------
+# Play ground
+if __name__ == '__main__':
+    # The workers are initialized in the main process only,
+    # since the display process imports this module in the spawning
+    multiprocessing.freeze_support()
 
-# ----------------------------------
-running_option.start()
-keyboard.on_press(keypress_callback, suppress=True)
+    video_capture_reader = VideoCaptureReader()
+    video_capture_reader.start()
+
+    video_frame_buffer = VideoFrameBuffer(video_capture_reader)
+    video_frame_buffer.start()
+
+    eeg_device_reader = EEGDeviceReader()
+    eeg_device_reader.start()
+
+    stm32_device_reader = Stm32DeviceReader(video_frame_buffer)
+    stm32_device_reader.start()
+
+    comprehensive_decoder = ComprehensiveDecoder()
+
+    main_window = MainWindow()
+
+    # The frames go to the sink instead of the window in the headless mode
+    if headless:
+        display = new_display_sink(main_window.screen_bgr.shape)
+    else:
+        display = DisplayProcess(main_window.screen_bgr.shape,
+                                 title=project_name)
+    display.start()
+
+    control_server = ControlServer(command_callback)
+    control_server.start()
 
-# %%
-if __name__ == '__main__':
-    # multiprocessing.freeze_support()
     # multiprocessing.Process(target=loop_prediction,
     #                         args=(1, ), daemon=True).start()
+    threading.Thread(target=loop_prediction,
+                     args=(comprehensive_decoder.predict_interval, ),
+                     daemon=True).start()
+
+    # ----------------------------------
+    running_option.start()
+    if not headless:
+        keyboard.on_press(keypress_callback, suppress=True)
 
     # ----------------------------------
 
@@ -161,9 +221,12 @@ if __name__ == '__main__':
 
     eeg_image = eeg_device_reader.placeholder_image()
     stm32_image = stm32_device_reader.placeholder_image()
+    video_seq = None
 
     while running_option.running:
-        video_image = video_capture_reader.read()
+        seq, _, video_image = video_capture_reader.read_display_frame()
+        video_image_refresh_flag = seq != video_seq
+        video_seq = seq
 
         pair = eeg_device_reader.read_bgr()
         eeg_image_refresh_flag = pair is not None
@@ -191,17 +254,27 @@ if __name__ == '__main__':
             main_window.overlay_stm32_panel(stm32_image)
 
         # ----------------------------------------------------------------
-        text = '{:04d} | {:06.2f} Fps'.format(
-            timestamp2milliseconds(delay), delay2fps(delay))
-        put_text(video_image, text, org=CONF['osd']['org'])
-        main_window.overlay_video_panel(video_image)
+        # The video panel is only overlaid with the new frame, so the screen is not dirty without the new data
+        if video_image_refresh_flag:
+            text = '{:04d} | {:06.2f} Fps'.format(
+                timestamp2milliseconds(delay), delay2fps(delay))
+            put_text(video_image, text, org=CONF['osd']['org'])
+            main_window.overlay_video_panel(video_image, video_seq)
 
         # ----------------------------------------------------------------
-        main_window.overlay_decoder_panel(comprehensive_decoder.bgr)
+        # The decoder panel is overlaid only if it is drawn again
+        decoder_seq, decoder_image = comprehensive_decoder.latest_bgr()
+        main_window.overlay_decoder_panel(decoder_image, decoder_seq)
+
+        # Only the changed screen is sent, the display process shows it
+        if main_window.take_dirty_rects():
+            display.show(main_window.screen_bgr)
+
+        for key in display.poll_keys():
+            command_callback(chr(key))
 
-        cv2.imshow(project_name, main_window.screen_bgr)
-        cv2.setWindowTitle(project_name, f'{project_name} - {tic}')
-        cv2.pollKey()
+        # Keep the frame rate not higher than the display
+        time.sleep(max(1 / display.fps - (time.time() - toc), 0))
 
         tic = time.time()
 
@@ -210,8 +283,14 @@ if __name__ == '__main__':
             running_option.stop()
 
     eeg_device_reader.stop()
+    video_frame_buffer.stop()
+    video_capture_reader.stop()
+    display.stop()
+    control_server.stop()
+    comprehensive_decoder.stop()
 
-    keyboard.unhook_all()
+    if not headless:
+        keyboard.unhook_all()
 
     # ----------------------------------------------------------------
     # Save data
@@ -222,18 +301,21 @@ if __name__ == '__main__':
 
     eeg_data = eeg_device_reader.peek_latest_data_by_length(length=10000)
     stm32_data = stm32_device_reader.peek_latest_data_by_length(length=10000)
+    video_data = video_frame_buffer.peek_latest_data_by_length(
+        length=video_frame_buffer.frame_budget)
 
     saved_data = dict(
         eeg_data=eeg_data,
         stm32_data=stm32_data,
+        video_data=video_data,
     )
 
     joblib.dump(saved_data, experiment_data_path, compress=3)
 
     LOGGER.debug(f'Saved experiment data into {experiment_data_path}')
 
-    print('Press any keyboard to continue..., or wait for 1 seconds')
-    cv2.waitKey(1 * 1000)
+    print('Wait for 1 seconds')
+    time.sleep(1)
 
 # %% ---- 2023-07-20 ------------------------
 # Pending
@@ -0,0 +1,82 @@
+"""
+File: test_eeg_device_reader.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Test the Curry8EEGReceiver, run with python -m pytest
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import socket
+
+import numpy as np
+
+from util.eeg_device_reader import Curry8EEGReceiver
+from util.NeuroScanMessage import pack_header
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+def test_queue_overflow_keeps_the_queued_packages():
+    '''
+    The consumer falls behind, the new packages are dropped,
+    and the queued packages are not overwritten by the receiving.
+    '''
+    channels, samples, packages = 4, 10, 20
+
+    receiver = Curry8EEGReceiver(channels, '127.0.0.1', 0, 1000)
+    receiver.pool_size = 8
+    receiver.info = dict(eegChan=channels, datasize=4)
+    receiver.allocate_body_pool(channels * samples * 4)
+
+    receiver.sock, server = socket.socketpair()
+    receiver.running = True
+
+    for j in range(packages):
+        start_sample = 1 + j * samples
+        body = np.full((samples, channels), j, dtype='<f4').tobytes()
+        server.sendall(pack_header('DATA', 2, 1, start_sample, len(body), len(body)))
+        server.sendall(body)
+    server.close()
+
+    # The stream ends with the closed connection
+    try:
+        receiver._stream_packages()
+    except ConnectionError:
+        pass
+
+    limit = receiver.pool_size - 2
+    assert receiver.buffer.qsize() == limit
+    assert receiver.metrics['dropped_packages'] == packages - limit
+
+    for j in range(limit):
+        _, data, start_sample, _ = receiver.get()
+        assert start_sample == 1 + j * samples
+        assert np.all(data == j)
+
+    receiver.sock.close()
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
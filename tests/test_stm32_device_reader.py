@@ -0,0 +1,72 @@
+"""
+File: test_stm32_device_reader.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Test the Stm32DeviceReader, run with python -m pytest
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from util.stm32_device_reader import Stm32DeviceReader
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+def test_host_time_search_with_refitted_clock():
+    '''
+    The refitted clock model moves the batch before the last one,
+    the aligned_ns column is still sorted, and the search finds the latest package not after the time.
+    '''
+    reader = Stm32DeviceReader()
+    reader.data_buffer = reader.new_data_buffer()
+    reader.last_aligned_ns = 0
+
+    batches = [np.array([100, 200, 300]),
+               np.array([250, 350, 450]),
+               np.array([440, 430, 600])]
+
+    idx = 0
+    for aligned_ns in batches:
+        n = len(aligned_ns)
+        columns = dict(idx=np.arange(idx, idx + n),
+                       timestamp=0.0,
+                       aligned_ns=reader._monotonic(aligned_ns))
+        for name in reader.channels_colors:
+            columns[name] = np.zeros(n)
+        reader.data_buffer.extend(**columns)
+        idx += n
+
+    column = reader.data_buffer.peek_latest(idx)['aligned_ns']
+    assert np.all(np.diff(column) >= 0)
+
+    assert reader.data_buffer.search('aligned_ns', 320) == 4
+    assert reader.data_buffer.search('aligned_ns', 460) == 8
+    assert reader.peek_data_by_host_time(460, 2)['idx'].tolist() == [6, 7]
+    assert reader.peek_data_by_host_time(700, 2) is None
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
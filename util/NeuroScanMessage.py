@@ -1,117 +1,105 @@
-from os import SEEK_CUR
-import numpy as np
+import struct
+
+
+# 20 字节的消息头：charID, code, request, samples, sizeBody, sizeUn
+HEADER_STRUCT = struct.Struct('>4sHHIII')
+
+
+def pack_header(charID, code, request, samples=0, sizeBody=0, sizeUn=0):
+    # 打包消息头
+    if isinstance(charID, str):
+        charID = charID.encode('ascii')
+
+    return HEADER_STRUCT.pack(charID, code, request, samples, sizeBody, sizeUn)
+
+
+def unpack_header(head):
+    # 解析消息头
+    charID, code, request, samples, sizeBody, sizeUn = HEADER_STRUCT.unpack(head)
+
+    return {
+        'charID': charID,
+        'code': code,
+        'request': request,
+        'startSample': samples,
+        'packetSize': sizeBody,
+        'packetSizeUn': sizeUn,
+    }
 
 
 class  NeuroScanMessage():
+    # infoType
+    infoType = dict(
+        InfoType_Version = 1,
+        InfoType_BasicInfo = 2,
+        InfoType_ChannelInfo = 4
+    )
+    # dataType
+    dataType = dict(
+        Data_Info = 1,
+        Data_Eeg = 2,
+        Data_Event = 3,
+        Data_Impedance = 4
+
+    )
+    # blockType
+    blockType = dict(
+        DataTypeFloat32bit = 1,
+        DataTypeEventList = 2
+    )
+    # requestType
+    requestType = dict(
+        RequestVersion = 1,
+        RequestChannelInfo = 3,
+        RequestBasicInfoAcq = 6,
+        RequestStreamingStart = 8,
+        RequestStreamingStop = 9
+    )
+    # controlCode
+    controlType = dict(
+        CTRL_FromServer = 1,
+        CTRL_FromClient = 2,
+    )
+
+    # 预先生成的请求，不可变的 bytes
+    VERSION = pack_header('CTRL', controlType['CTRL_FromClient'], requestType['RequestVersion'])
+    BASIC_INFO = pack_header('CTRL', controlType['CTRL_FromClient'], requestType['RequestBasicInfoAcq'])
+    CHANNEL_INFO = pack_header('CTRL', controlType['CTRL_FromClient'], requestType['RequestChannelInfo'])
+    STREAMING_START = pack_header('CTRL', controlType['CTRL_FromClient'], requestType['RequestStreamingStart'])
+    STREAMING_STOP = pack_header('CTRL', controlType['CTRL_FromClient'], requestType['RequestStreamingStop'])
+
     def __init__(self) -> None:
-        # 初始化，定义各种请求类型
+        # 初始化，请求类型已经定义在类中
         self.initial()
 
 
     def initial(self):
-        # infoType
-        self.dataType = dict(
-            InfoType_Version = 1,
-            InfoType_BasicInfo = 2,
-            InfoType_ChannelInfo = 4
-        )
-        # dataType
-        self.dataType = dict(
-            Data_Info = 1,
-            Data_Eeg = 2,
-            Data_Event = 3,
-            Data_Impedance = 4
-
-        )
-        # blockType
-        self.blockType = dict(
-            DataTypeFloat32bit = 1,
-            DataTypeEventList = 2
-        )
-        # requestType
-        self.requestType = dict(
-            RequestVersion = 1,
-            RequestChannelInfo = 3,
-            RequestBasicInfoAcq = 6,
-            RequestStreamingStart = 8,
-            RequestStreamingStop = 9
-        )
-        # controlCode
-        self.controlType = dict(
-            CTRL_FromServer = 1,
-            CTRL_FromClient = 2,
-        )
-
         return self
 
-    def _convertMessage(self,charID,code,request,samples,sizeBody,sizeUn):
-        # 格式化
-        self.charID = np.fromstring(charID,dtype='uint8')
-        self.code = np.uint16([code])
-        self.request = np.uint16([request])
-        self.samples = np.uint32([samples])
-        self.sizeBody = np.uint32([sizeBody])
-        self.sizeUn = np.uint32([sizeUn])
-        
-        return self
-
-
     def initHeader(self,charID,code,request,samples,sizeBody,sizeUn):
 
-        self._convertMessage(charID,code,request,samples,sizeBody,sizeUn)
-        # char 
-        charFlow = self.charID
-        # code
-        codeflow = self.code.byteswap().view(np.uint8)
-        # request
-        requestFlow = self.request.byteswap().view(np.uint8)
-        # samples
-        samples = self.samples .byteswap().view(np.uint8)
-        # sizeBody
-        sizeBody = self.sizeBody.byteswap().view(np.uint8)
-        # sizeUn
-        sizeUn = self.sizeUn.byteswap().view(np.uint8)
+        return pack_header(charID,code,request,samples,sizeBody,sizeUn)
 
-        flow = np.concatenate((charFlow,codeflow,requestFlow,samples,sizeBody,sizeUn))
+    def getVersion(self):
 
-        return flow
+        return self.VERSION
 
     def startStreaming(self):
-        
+
         # start sending data
 
-        header = self.initHeader(
-            charID='CTRL',
-            code=self.controlType['CTRL_FromClient'],
-            request=self.requestType['RequestStreamingStart'],
-            samples=0,sizeBody=0,sizeUn=0
-        )
+        return self.STREAMING_START
 
-        return header
-    
-    def getChannelInfo(self):
+    def stopStreaming(self):
 
-        header = self.initHeader(
-            charID='CTRL',
-            code=self.controlType['CTRL_FromClient'],
-            request=self.requestType['RequestChannelInfo'],
-            samples=0,sizeBody=0,sizeUn=0
-        )
+        # stop sending data
 
+        return self.STREAMING_STOP
 
-        return header
-
-    def getBasicInfo(self):
+    def getChannelInfo(self):
 
-        header = self.initHeader(
-            charID='CTRL',
-            code=self.controlType['CTRL_FromClient'],
-            request=self.requestType['RequestBasicInfoAcq'],
-            samples=0,sizeBody=0,sizeUn=0
-        )
-        
+        return self.CHANNEL_INFO
 
-        return header
-        
-        
+    def getBasicInfo(self):
 
+        return self.BASIC_INFO
@@ -43,7 +43,10 @@ eeg_config = dict(
     display_window_length=5,  # seconds
     display_pixel_width=400,  # pixels
     display_pixel_height=500,  # pixels
-    display_dpi=100,  # DPI
+    display_fps=30,  # the max frames per second of the panel
+    display_scale='minmax',  # 'minmax' or 'percentile', how to scale the channels
+    gap_fill='interpolate',  # 'nan' or 'interpolate', how to fill the lost samples
+    gap_interpolate_limit=100,  # samples, the longer gap is filled with NaN
     not_exist='Not exist option',
 )
 
@@ -53,9 +56,12 @@ stm32_config = dict(
     display_window_length=5,  # seconds
     display_pixel_width=400,  # pixels
     display_pixel_height=400,  # pixels
-    display_dpi=100,  # DPI
+    display_fps=30,  # the max frames per second of the panel
+    display_scale='minmax',  # 'minmax' or 'percentile', how to scale the channels
     port='COM6',  # port name
     baudrate=115200,  # baudrate
+    frame_header='',  # hex string of the frame header, not checked if empty
+    frame_checksum=False,  # whether the last byte of the frame is the checksum
     channels_colors=dict(  # channels and their colors
         ecg='#a00000',  # 心电
         eda='#00a000',  # 皮电
@@ -68,7 +74,14 @@ decoder_config = dict(
     stm32_data_length=1000,  # milliseconds
     display_pixel_width=400,  # pixels
     display_pixel_height=200,  # pixels
-    display_dpi=100,  # DPI
+    url='ws://localhost:8765',  # url of the decoding backend
+    predict_interval=1,  # seconds between the predictions
+    max_in_flight=4,  # max number of the predictions waiting for the results
+    request_timeout=5,  # seconds before the prediction fails
+    reconnect_interval=1,  # seconds between the reconnections
+    eeg_float16=False,  # whether to send the eeg data in float16
+    face_codec='raw',  # 'raw' or 'jpeg', how to send the face image
+    jpeg_quality=90,  # quality of the jpeg, 0 ~ 100
 )
 
 video_config = dict(
@@ -77,6 +90,11 @@ video_config = dict(
     display_height=300,  # px
 )
 
+video_buffer_config = dict(
+    frame_budget=100,  # number of frames being kept
+    record_fps=10,  # frames per second being recorded
+)
+
 keyboard_config = dict(
     quite_key_code='q'  # Press the key to quite
 )
@@ -94,6 +112,29 @@ main_window_config = dict(
     decoder_panel_y=520  # px, offset y of decoder panel
 )
 
+display_config = dict(
+    headless=False,  # whether to run without window
+    fps=30,  # the max frames per second of the window
+    slots=3,  # the number of the slots of the shared memory ring
+)
+
+display_sink_config = dict(
+    name='null',  # 'null', 'snapshot', 'mjpeg' or 'video', the sink in the headless mode
+    fps=30,  # the max frames per second being written
+    snapshot_path='snapshots',  # folder of the png snapshots
+    snapshot_rate=1,  # snapshots per second
+    mjpeg_host='127.0.0.1',  # host of the mjpeg http server
+    mjpeg_port=8080,  # port of the mjpeg http server
+    jpeg_quality=80,  # quality of the jpeg, 0 ~ 100
+    video_path='display.avi',  # path of the video file
+    video_fourcc='MJPG',  # fourcc of the video file
+)
+
+control_config = dict(
+    host='127.0.0.1',  # host of the control socket
+    port=5800,  # port of the control socket
+)
+
 osd_config = dict(
     org=(10, 20),  # (px in x-axis, px in y-axis), the bottom-left corner of the osd
 )
@@ -105,8 +146,12 @@ main_config = dict(
     eeg=eeg_config,
     stm32=stm32_config,
     video=video_config,
+    video_buffer=video_buffer_config,
     keyboard=keyboard_config,
     main_window=main_window_config,
+    display=display_config,
+    display_sink=display_sink_config,
+    control=control_config,
     osd=osd_config,
     decoder=decoder_config
 )
@@ -0,0 +1,184 @@
+"""
+File: clock_sync.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Align the device clocks to the host clock
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import time
+
+import numpy as np
+
+from threading import Lock
+
+from . import LOGGER
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+def now_ns():
+    """The host clock for the alignment.
+
+    Returns:
+        int: The time.monotonic_ns().
+    """
+    return time.monotonic_ns()
+
+
+class ClockSync(object):
+    '''
+    Align the device clock to the host clock.
+
+    The device clock is the sample counter, like the startSample of Curry8 or the idx of STM32,
+    the host clock is the time.monotonic_ns().
+
+    The running linear model of host_ns = offset + period x counter is fitted
+    with the exponentially weighted least squares of the (counter, arrival time) pairs,
+    so the jitter of the thread scheduling is smoothed out of the aligned timestamps,
+    and the drift of the device clock is followed by the period.
+    '''
+    forgetting = 0.99  # The weight decay of the previous pairs
+
+    def __init__(self, sample_rate, name='device'):
+        self.sample_rate = sample_rate
+        self.name = name
+        self.nominal_period_ns = 1e9 / sample_rate
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset the model, it is required when the device counter restarts.
+        """
+        # The (counter, host_ns) of the first pair, the model is relative to it
+        self.reference = None
+        self.last_counter = None
+        self.pairs = 0
+
+        # The exponentially weighted statistics
+        self.weight = 0.0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+        self.jitter_ns = 0.0
+
+        self.period_ns = self.nominal_period_ns
+        self.offset_ns = 0.0
+
+    def update(self, counter, host_ns=None):
+        """Update the model with the arrival of the counter.
+
+        Args:
+            counter (int): The device sample counter;
+            host_ns (int, optional): The arrival time on the host clock. Defaults to now_ns().
+
+        Returns:
+            int: The aligned host time of the counter.
+        """
+        host_ns = now_ns() if host_ns is None else host_ns
+
+        with self.lock:
+            if self.last_counter is not None and counter < self.last_counter:
+                LOGGER.warning(
+                    f'The {self.name} counter restarts from {self.last_counter} to {counter}')
+                self.reset()
+
+            if self.reference is None:
+                self.reference = (counter, host_ns)
+
+            x = float(counter - self.reference[0])
+            y = float(host_ns - self.reference[1])
+
+            if self.pairs > 0:
+                residual = y - (self.offset_ns + self.period_ns * x)
+                self.jitter_ns = self.forgetting * self.jitter_ns + \
+                    (1 - self.forgetting) * abs(residual)
+
+            self.weight = self.forgetting * self.weight + 1
+            dx = x - self.mean_x
+            dy = y - self.mean_y
+            self.mean_x += dx / self.weight
+            self.mean_y += dy / self.weight
+            self.sxx = self.forgetting * self.sxx + dx * (x - self.mean_x)
+            self.sxy = self.forgetting * self.sxy + dx * (y - self.mean_y)
+
+            if self.sxx > 0:
+                self.period_ns = self.sxy / self.sxx
+            self.offset_ns = self.mean_y - self.period_ns * self.mean_x
+
+            self.last_counter = counter
+            self.pairs += 1
+
+        return self.to_host_ns(counter)
+
+    def is_ready(self):
+        return self.reference is not None
+
+    def to_host_ns(self, counter):
+        """Convert the device counter into the aligned host time.
+
+        Args:
+            counter (int or array): The device sample counter.
+
+        Returns:
+            int or array: The host time in nanoseconds, None if the model is not ready.
+        """
+        if self.reference is None:
+            return None
+
+        x = np.asarray(counter, dtype=np.float64) - self.reference[0]
+        host_ns = self.reference[1] + np.round(self.offset_ns + self.period_ns * x)
+
+        if np.ndim(host_ns) == 0:
+            return int(host_ns)
+        return host_ns.astype(np.int64)
+
+    def to_counter(self, host_ns):
+        """Convert the host time into the device counter, it is the latest counter not after the host_ns.
+
+        Args:
+            host_ns (int): The host time in nanoseconds.
+
+        Returns:
+            int: The device sample counter, None if the model is not ready.
+        """
+        if self.reference is None:
+            return None
+
+        y = float(host_ns - self.reference[1])
+        return self.reference[0] + int(np.floor((y - self.offset_ns) / self.period_ns))
+
+    def drift_ppm(self):
+        """The drift of the device clock against its nominal sample rate.
+
+        Returns:
+            float: The drift in parts per million.
+        """
+        return (self.period_ns / self.nominal_period_ns - 1) * 1e6
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -18,13 +18,18 @@ Functions:
 
 # %% ---- 2023-08-09 ------------------------
 # Requirements and constants
-import io
+import json
 import time
+import itertools
 
+from threading import Thread, Lock
+from concurrent.futures import Future
 from websockets.sync.client import connect
 
 import numpy as np
 
+from decoding.wire_format import encode
+
 from . import LOGGER, CONF
 from .toolbox import uint8, put_text
 # from .predict_model.Predict import predict
@@ -32,19 +37,183 @@ from .toolbox import uint8, put_text
 
 # %% ---- 2023-08-09 ------------------------
 # Function and class
+class DecoderClient(object):
+    '''
+    Long-lived websocket connection to the decoding backend.
+
+    Every request is sent with its id, and several requests are in flight on the connection,
+    the replies are matched to the requests by the ids in the receiving thread.
+    The connection is reconnected after it is lost, and the requests in flight fail at once.
+    '''
+
+    def __init__(self, url, max_in_flight=4, request_timeout=5, reconnect_interval=1):
+        """Initialize the client.
+
+        Args:
+            url (str): The url of the decoding backend;
+            max_in_flight (int, optional): The max number of the requests waiting for the replies. Defaults to 4;
+            request_timeout (float, optional): The seconds before the request fails. Defaults to 5;
+            reconnect_interval (float, optional): The seconds between the reconnections. Defaults to 1.
+        """
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        self.reconnect_interval = reconnect_interval
+
+        self.ws = None
+        # request_id: (future, deadline)
+        self.pending = {}
+        self.lock = Lock()
+        self.send_lock = Lock()
+        self.request_ids = itertools.count()
+        self.running = False
+
+    def start(self):
+        if self.running:
+            LOGGER.error('Can not start, since it is already running')
+            return
+
+        self.running = True
+        Thread(target=self._keep_connection, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+        with self.lock:
+            ws = self.ws
+
+        if ws is not None:
+            ws.close()
+
+    def _keep_connection(self):
+        while self.running:
+            try:
+                with connect(self.url, close_timeout=1) as ws:
+                    with self.lock:
+                        self.ws = ws
+                    LOGGER.debug(f'Connected to {self.url}')
+
+                    while self.running:
+                        # The timeout is to expire the requests without the replies
+                        try:
+                            self._resolve(ws.recv(timeout=0.5))
+                        except TimeoutError:
+                            pass
+                        self._fail_pending(expired_only=True)
+
+            except Exception as err:
+                if self.running:
+                    LOGGER.error(f'Decoder connection fails: {err}')
+
+            with self.lock:
+                self.ws = None
+            self._fail_pending()
+
+            if self.running:
+                time.sleep(self.reconnect_interval)
+
+        LOGGER.debug(f'Decoder connection stops, {self.url}')
+
+    def _resolve(self, message):
+        reply = json.loads(message)
+
+        with self.lock:
+            pair = self.pending.pop(reply['id'], None)
+
+        if pair is None:
+            LOGGER.warning(f'Drop the reply of the expired request: {reply}')
+            return
+
+        pair[0].set_result(reply['message'])
+
+    def _fail_pending(self, expired_only=False):
+        now = time.time()
+
+        with self.lock:
+            request_ids = [request_id for request_id, (_, deadline) in self.pending.items()
+                           if deadline < now or not expired_only]
+            pairs = [self.pending.pop(request_id) for request_id in request_ids]
+
+        for future, _ in pairs:
+            if expired_only:
+                future.set_exception(TimeoutError('The request is expired'))
+            else:
+                future.set_exception(ConnectionError('The connection is lost'))
+
+    def submit(self, arrays, **options):
+        """Send the request, it does not wait for the reply.
+
+        Args:
+            arrays (list): The np.array being sent in order;
+            options: The options of the encoding, see wire_format.encode.
+
+        Returns:
+            Future: The future of the message being replied.
+        """
+        future = Future()
+
+        with self.lock:
+            ws = self.ws
+
+            if ws is None:
+                future.set_exception(
+                    ConnectionError(f'Not connected to {self.url}'))
+                return future
+
+            if len(self.pending) >= self.max_in_flight:
+                future.set_exception(
+                    RuntimeError(f'Too many requests in flight: {len(self.pending)}'))
+                return future
+
+            request_id = next(self.request_ids)
+            self.pending[request_id] = (
+                future, time.time() + self.request_timeout)
+
+        try:
+            frame = encode(request_id, arrays, **options)
+            with self.send_lock:
+                ws.send(frame)
+        except Exception as err:
+            # The future is failed by the connection thread if it is not pending
+            with self.lock:
+                pair = self.pending.pop(request_id, None)
+            if pair is not None:
+                future.set_exception(err)
+
+        return future
+
+
 class ComprehensiveDecoder(object):
     eeg_data_length = 1000  # milliseconds
     stm32_data_length = 1000  # milliseconds
     display_pixel_width = 400  # pixels
     display_pixel_height = 200  # pixels
-    display_dpi = 100  # DPI
+    url = 'ws://localhost:8765'  # url of the decoding backend
+    predict_interval = 1  # seconds between the predictions
+    max_in_flight = 4  # max number of the predictions waiting for the results
+    request_timeout = 5  # seconds before the prediction fails
+    reconnect_interval = 1  # seconds between the reconnections
+    eeg_float16 = False  # whether to send the eeg data in float16
+    face_codec = 'raw'  # 'raw' or 'jpeg', how to send the face image
+    jpeg_quality = 90  # quality of the jpeg, 0 ~ 100
 
     def __init__(self):
         self.conf_override()
 
         LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
 
-        self.bgr = self.empty_bgr()
+        # The (seq, bgr) of the latest drawn panel, the seq increases at every drawing
+        self.draw_seqs = itertools.count(1)
+        self.drawn = (0, self.empty_bgr())
+
+        self.client = DecoderClient(self.url,
+                                    max_in_flight=self.max_in_flight,
+                                    request_timeout=self.request_timeout,
+                                    reconnect_interval=self.reconnect_interval)
+        self.client.start()
+
+    def stop(self):
+        self.client.stop()
 
     def empty_bgr(self):
         return uint8(
@@ -78,58 +247,67 @@ class ComprehensiveDecoder(object):
 
     #     return predict(stm32_data, eeg_data, face_img_in_bgr)
 
-    def predict(self, stm32_data, eeg_data, face_img_in_bgr):
-        """Predict the status based on the input.
+    def predict(self, stm32_data, eeg_data, face_img_in_bgr, capture_ns=0):
+        """Predict the status based on the input, and wait for the result.
+        See submit for the details.
+
+        Returns:
+            prediction value
+        """
+        return self.submit(stm32_data, eeg_data, face_img_in_bgr, capture_ns).result()
+
+    def submit(self, stm32_data, eeg_data, face_img_in_bgr, capture_ns=0):
+        """Predict the status based on the input, it does not wait.
+        The result is drawn when it is received.
 
         Args:
             stm32_data (np.array): 3 x n array, n is the samples, 3 refers eog, emg and temperature channels;
             eeg_data (np.array): chs x n array, chs is the number of eeg channels, n is the samples;
-            face_img_in_bgr (np.array): height x width x 3, the image from the camera.
+            face_img_in_bgr (np.array): height x width x 3, the image from the camera;
+            capture_ns (int, optional): The host time of the data, see ClockSync. Defaults to 0.
 
         Res table:
             Numbers no-less than 0, refers the decoding result is correct;
-            -100 refers can not connect to the decoding backend;
+            -100 refers can not connect to the decoding backend, or the request fails;
             -1 refers the stm32_data shape is incorrect;
             -2 refers the eeg_data shape is incorrect;
             other string refers the runtime error of the predict function.
 
         Returns:
-            prediction value
+            Future: The future of the prediction value.
         """
 
         tic = time.time()
+        output = Future()
 
-        res = -100
         # res = self.predict_computation(stm32_data, eeg_data, face_img_in_bgr)
 
-        def hello():
-            with connect("ws://localhost:8765", close_timeout=1) as ws:
-
-                io_send = io.BytesIO()
-                np.save(io_send, eeg_data)
-                np.save(io_send, stm32_data)
-                np.save(io_send, face_img_in_bgr)
-                byte_array = io_send.getvalue()
-                print(len(byte_array))
+        def finish(request):
+            res = -100
 
-                # ws.send("Hello world!")
-                ws.send(byte_array)
+            try:
+                res = request.result()
+                print(f"Received: {res}")
+            except Exception as err:
+                LOGGER.error(f"Failed to request decoded message: {err}")
 
-                message = ws.recv()
-                print(f"Received: {message}")
+            time_cost = time.time() - tic
 
-                return message
+            text = f'Predict value: {res}, Cost: {time_cost:.2f} seconds.'
+            print(text)
+            self.draw(text)
 
-        try:
-            res = hello()
-        except Exception as err:
-            LOGGER.error(f"Failed to request decoded message: {err}")
+            output.set_result(text)
 
-        time_cost = time.time() - tic
+        codecs = ['float16' if self.eeg_float16 else 'raw',
+                  'raw',
+                  self.face_codec]
 
-        output = f'Predict value: {res}, Cost: {time_cost:.2f} seconds.'
-        print(output)
-        self.draw(output)
+        request = self.client.submit([eeg_data, stm32_data, face_img_in_bgr],
+                                     codecs=codecs,
+                                     capture_ns=capture_ns,
+                                     jpeg_quality=self.jpeg_quality)
+        request.add_done_callback(finish)
 
         return output
 
@@ -138,9 +316,17 @@ class ComprehensiveDecoder(object):
         put_text(bgr, res, fontScale=0.5)
         put_text(bgr, f'Finished at: {time.time():0.2f}',
                  org=(10, 20), fontScale=0.5)
-        self.bgr = bgr
+        self.drawn = (next(self.draw_seqs), bgr)
         return bgr
 
+    def latest_bgr(self):
+        """The latest drawn panel, the seq tells whether it is changed.
+
+        Returns:
+            tuple: The (seq, bgr) of the panel.
+        """
+        return self.drawn
+
 
 # %% ---- 2023-08-09 ------------------------
 # Play ground
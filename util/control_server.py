@@ -0,0 +1,137 @@
+"""
+File: control_server.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Control the runtime from the local socket
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import sys
+import socket
+import socketserver
+
+from threading import Thread
+
+from . import LOGGER, CONF
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class ReusableTCPServer(socketserver.ThreadingTCPServer):
+    '''
+    The threading TCP server, the port is reused at once after the restart.
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ControlServer(object):
+    '''
+    Receive the commands from the local socket,
+    every line is a command, like the name of the key being pressed,
+    and the reply is the line of 'ok'.
+
+    Send the command with the CLI:
+    python -m util.control_server q
+    '''
+    host = '127.0.0.1'  # host of the control socket
+    port = 5800  # port of the control socket
+
+    def __init__(self, callback):
+        """Initialize the server.
+
+        Args:
+            callback (function): The function of the command, it is called in the thread of the connection.
+        """
+        self.conf_override()
+        self.callback = callback
+        self.server = None
+
+        LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
+
+    def conf_override(self):
+        for key, value in CONF['control'].items():
+            if not (hasattr(self, key)):
+                LOGGER.warning(f'Invalid key: {key} in CONF')
+                continue
+            setattr(self, key, value)
+
+        LOGGER.debug('Override the options with CONF')
+
+    def start(self):
+        if self.server is not None:
+            LOGGER.error('Can not start, since it is already running')
+            return
+
+        callback = self.callback
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    command = line.decode('utf-8', errors='ignore').strip()
+                    if not command:
+                        continue
+
+                    LOGGER.debug(f'Control command {command}')
+                    callback(command)
+                    self.wfile.write(b'ok\n')
+
+        self.server = ReusableTCPServer((self.host, self.port), Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+        LOGGER.debug(f'Control server starts on {self.host}:{self.port}')
+
+    def stop(self):
+        if self.server is None:
+            return
+
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+
+def send_command(command, host=None, port=None):
+    """Send the command to the control server.
+
+    Args:
+        command (str): The command;
+        host (str, optional): The host of the server. Defaults to None, refers CONF['control']['host'];
+        port (int, optional): The port of the server. Defaults to None, refers CONF['control']['port'].
+
+    Returns:
+        str: The reply.
+    """
+    host = host or CONF['control']['host']
+    port = port or CONF['control']['port']
+
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall(command.encode('utf-8') + b'\n')
+        return sock.makefile().readline().strip()
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+if __name__ == '__main__':
+    print(send_command(' '.join(sys.argv[1:])))
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
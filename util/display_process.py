@@ -0,0 +1,270 @@
+"""
+File: display_process.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Show the main window in its own process
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import cv2
+import queue
+import multiprocessing
+
+import numpy as np
+
+from multiprocessing import shared_memory
+
+from . import LOGGER, CONF
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class SharedFrameRing(object):
+    '''
+    Ring of the frames in the shared memory, for one writer process and one reader process.
+
+    The header holds the seq of the latest frame and the seqs of the frames in the slots,
+    the writer writes the frame into the next slot and then publishes its seq,
+    the reader copies the latest frame, and drops it if its slot is overwritten in the copying.
+    So the writer never waits for the reader, and the reader only gets the latest frame.
+    '''
+
+    def __init__(self, shape, slots=3, name=None):
+        """Initialize the ring.
+
+        Args:
+            shape (tuple): The shape of the uint8 frame;
+            slots (int, optional): The number of the slots. Defaults to 3;
+            name (str, optional): The name of the existing shared memory. Defaults to None, refers creating the shared memory.
+        """
+        self.shape = tuple(shape)
+        self.slots = slots
+
+        header_size = (slots + 1) * np.dtype(np.int64).itemsize
+        frame_size = int(np.prod(self.shape))
+
+        self.created = name is None
+        self.shm = shared_memory.SharedMemory(name=name,
+                                              create=self.created,
+                                              size=header_size + slots * frame_size)
+        self.name = self.shm.name
+
+        # header[0] is the seq of the latest frame, header[1 + j] is the seq of the frame in the slot j
+        self.header = np.ndarray((slots + 1, ), dtype=np.int64,
+                                 buffer=self.shm.buf)
+        self.frames = np.ndarray((slots, *self.shape), dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=header_size)
+
+        if self.created:
+            self.header[:] = -1
+
+    def write(self, bgr):
+        """Write the frame into the ring.
+
+        Args:
+            bgr (np.array): The frame of the shape.
+
+        Returns:
+            int: The seq of the frame.
+        """
+        seq = int(self.header[0]) + 1
+        slot = seq % self.slots
+
+        # The slot is invalid in the writing
+        self.header[1 + slot] = -1
+        self.frames[slot] = bgr
+        self.header[1 + slot] = seq
+        self.header[0] = seq
+        return seq
+
+    def read_latest(self, after=-1):
+        """Read the latest frame.
+
+        Args:
+            after (int, optional): The seq of the frame being read. Defaults to -1.
+
+        Returns:
+            tuple: The (seq, bgr) of the latest frame, None if there is no new frame.
+        """
+        seq = int(self.header[0])
+        if seq <= after:
+            return None
+
+        slot = seq % self.slots
+        bgr = self.frames[slot].copy()
+
+        # The slot is overwritten in the copying
+        if self.header[1 + slot] != seq:
+            return None
+
+        return seq, bgr
+
+    def close(self):
+        """Close the ring, the shared memory is released by its creator.
+        """
+        del self.header
+        del self.frames
+        self.shm.close()
+
+        if self.created:
+            self.shm.unlink()
+
+
+def display_loop(name, shape, slots, title, fps, stop_event, keys):
+    """The loop of the display process,
+    it shows the latest frame in the ring, and sends the pressed keys back.
+
+    Args:
+        name (str): The name of the shared memory of the ring;
+        shape (tuple): The shape of the frame;
+        slots (int): The number of the slots of the ring;
+        title (str): The title of the window;
+        fps (int): The max frames per second;
+        stop_event (multiprocessing.Event): The event to stop the loop;
+        keys (multiprocessing.Queue): The queue of the pressed keys.
+    """
+    ring = SharedFrameRing(shape, slots, name=name)
+    delay = max(int(1000 / fps), 1)
+    seq = -1
+
+    try:
+        while not stop_event.is_set():
+            frame = ring.read_latest(after=seq)
+            if frame is not None:
+                seq, bgr = frame
+                cv2.imshow(title, bgr)
+
+            key = cv2.waitKey(delay)
+            if key != -1:
+                keys.put(key & 0xFF)
+
+    finally:
+        cv2.destroyAllWindows()
+        ring.close()
+
+
+class DisplayProcess(object):
+    '''
+    Show the frames in the display process.
+
+    The frames are sent through the shared memory ring with the latest-frame policy,
+    so the process sending the frames never waits for the GUI.
+    In the headless mode, there is no window at all, see DisplaySink for the frames.
+    '''
+    headless = False  # whether to run without window
+    fps = 30  # the max frames per second of the window
+    slots = 3  # the number of the slots of the shared memory ring
+
+    def __init__(self, shape, title='Display'):
+        """Initialize the display.
+
+        Args:
+            shape (tuple): The shape of the frame, (height x width x 3);
+            title (str, optional): The title of the window. Defaults to 'Display'.
+        """
+        self.conf_override()
+        self.shape = tuple(shape)
+        self.title = title
+        self.ring = None
+        self.process = None
+
+        LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
+
+    def conf_override(self):
+        for key, value in CONF['display'].items():
+            if not (hasattr(self, key)):
+                LOGGER.warning(f'Invalid key: {key} in CONF')
+                continue
+            setattr(self, key, value)
+
+        LOGGER.debug('Override the options with CONF')
+
+    def start(self):
+        if self.headless:
+            LOGGER.warning(
+                'The display is running on headless mode, use the DisplaySink instead')
+            return
+
+        if self.process is not None:
+            LOGGER.error('Can not start, since it is already running')
+            return
+
+        # Spawn the process on every platform, so it never inherits the threads and locks of the parent,
+        # only the picklable arguments are sent to it, and the frames come through the ring
+        context = multiprocessing.get_context('spawn')
+
+        self.ring = SharedFrameRing(self.shape, self.slots)
+        self.stop_event = context.Event()
+        self.keys = context.Queue()
+
+        self.process = context.Process(target=display_loop,
+                                       args=(self.ring.name, self.shape, self.slots, self.title,
+                                             self.fps, self.stop_event, self.keys),
+                                       daemon=True)
+        self.process.start()
+
+        LOGGER.debug(f'Display process starts, pid={self.process.pid}')
+
+    def show(self, bgr):
+        """Send the frame to the display process, it does not wait.
+
+        Args:
+            bgr (np.array): The frame of the shape.
+        """
+        if self.ring is not None:
+            self.ring.write(bgr)
+
+    def poll_keys(self):
+        """Get the keys pressed in the window.
+
+        Returns:
+            list: The key codes.
+        """
+        keys = []
+        if self.process is None:
+            return keys
+
+        while True:
+            try:
+                keys.append(self.keys.get_nowait())
+            except queue.Empty:
+                return keys
+
+    def stop(self):
+        if self.process is None:
+            return
+
+        self.stop_event.set()
+        self.process.join(timeout=1)
+        self.process = None
+
+        self.ring.close()
+        self.ring = None
+
+        LOGGER.debug('Display process stops')
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
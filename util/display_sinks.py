@@ -0,0 +1,299 @@
+"""
+File: display_sinks.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Sinks of the main window frames in the headless mode
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import cv2
+import time
+
+from pathlib import Path
+from threading import Thread, Condition
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from . import LOGGER, CONF
+from .render_scheduler import RenderScheduler, LatestFrameMailbox
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class DisplaySink(object):
+    '''
+    The sink of the main window frames, it is used instead of the window in the headless mode.
+
+    The frames are put into the latest-frame mailbox,
+    and they are written by the sink in its own thread at most write_rate() times per second,
+    so the sender never waits for the writing.
+    '''
+    name = 'null'  # 'null', 'snapshot', 'mjpeg' or 'video'
+    fps = 30  # the max frames per second being written
+    snapshot_path = 'snapshots'  # folder of the png snapshots
+    snapshot_rate = 1  # snapshots per second
+    mjpeg_host = '127.0.0.1'  # host of the mjpeg http server
+    mjpeg_port = 8080  # port of the mjpeg http server
+    jpeg_quality = 80  # quality of the jpeg, 0 ~ 100
+    video_path = 'display.avi'  # path of the video file
+    video_fourcc = 'MJPG'  # fourcc of the video file
+
+    def __init__(self, shape):
+        """Initialize the sink.
+
+        Args:
+            shape (tuple): The shape of the frame, (height x width x 3).
+        """
+        self.conf_override()
+        self.shape = tuple(shape)
+        self.running = False
+        self.written = 0
+
+        LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
+
+    def conf_override(self):
+        for key, value in CONF['display_sink'].items():
+            if not (hasattr(self, key)):
+                LOGGER.warning(f'Invalid key: {key} in CONF')
+                continue
+            setattr(self, key, value)
+
+        LOGGER.debug('Override the options with CONF')
+
+    def write_rate(self):
+        return self.fps
+
+    def start(self):
+        if self.running:
+            LOGGER.error('Can not start, since it is already running')
+            return
+
+        self.running = True
+        self.mailbox = LatestFrameMailbox()
+        self.render_scheduler = RenderScheduler(self.write_rate())
+        self.open()
+
+        self.thread = Thread(target=self._write_frames, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.running = False
+        self.thread.join(timeout=1)
+        self.close()
+
+    def show(self, bgr):
+        """Send the frame to the sink, it does not wait.
+
+        Args:
+            bgr (np.array): The frame, it is copied.
+        """
+        if not self.running:
+            return
+
+        self.mailbox.put(time.time(), bgr.copy())
+        self.render_scheduler.notify()
+
+    def poll_keys(self):
+        """There is no key pressed in the sink.
+
+        Returns:
+            list: The empty list.
+        """
+        return []
+
+    def _write_frames(self):
+        LOGGER.debug(f'Write frames loop starts, {self.name}')
+
+        while self.running:
+            # The timeout is to check the self.running
+            if not self.render_scheduler.wait(timeout=0.5):
+                continue
+
+            frame = self.mailbox.take()
+            if frame is None:
+                continue
+
+            try:
+                self.write(frame[1])
+                self.written += 1
+            except Exception as err:
+                LOGGER.error(f'Write frame fails, {err}')
+
+        LOGGER.debug(f'Write frames loop stops, {self.name}')
+
+    def open(self):
+        return
+
+    def write(self, bgr):
+        return
+
+    def close(self):
+        return
+
+
+class NullSink(DisplaySink):
+    '''
+    Drop the frames, it is for benchmarking the pipeline.
+    '''
+
+    def show(self, bgr):
+        return
+
+
+class SnapshotSink(DisplaySink):
+    '''
+    Save the frames into the png snapshots at snapshot_rate.
+    '''
+
+    def write_rate(self):
+        return self.snapshot_rate
+
+    def open(self):
+        Path(self.snapshot_path).mkdir(exist_ok=True, parents=True)
+
+    def write(self, bgr):
+        cv2.imwrite(str(Path(self.snapshot_path, f'{self.written:06d}.png')), bgr)
+
+
+class MjpegSink(DisplaySink):
+    '''
+    Serve the frames as the mjpeg stream over the local http server,
+    open http://mjpeg_host:mjpeg_port in the browser.
+    '''
+
+    def open(self):
+        self.condition = Condition()
+        self.jpeg = None
+        self.jpeg_seq = 0
+
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+
+                seq = 0
+                try:
+                    while sink.running:
+                        with sink.condition:
+                            sink.condition.wait_for(
+                                lambda: sink.jpeg_seq != seq or not sink.running, timeout=1)
+                            seq, jpeg = sink.jpeg_seq, sink.jpeg
+
+                        if jpeg is None:
+                            continue
+
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n')
+                        self.wfile.write(
+                            f'Content-Length: {len(jpeg)}\r\n\r\n'.encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b'\r\n')
+
+                except (BrokenPipeError, ConnectionResetError):
+                    LOGGER.debug('The mjpeg client is disconnected')
+
+            def log_message(self, format, *args):
+                return
+
+        self.server = ThreadingHTTPServer(
+            (self.mjpeg_host, self.mjpeg_port), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+        LOGGER.debug(
+            f'Serve mjpeg on http://{self.mjpeg_host}:{self.server.server_port}')
+
+    def write(self, bgr):
+        success_flag, jpeg = cv2.imencode(
+            '.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not success_flag:
+            return
+
+        with self.condition:
+            self.jpeg = jpeg.tobytes()
+            self.jpeg_seq += 1
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class VideoFileSink(DisplaySink):
+    '''
+    Encode the frames into the video file,
+    the frames are dropped if the writing is slower than them.
+    '''
+
+    def open(self):
+        height, width = self.shape[:2]
+        self.writer = cv2.VideoWriter(self.video_path,
+                                      cv2.VideoWriter_fourcc(*self.video_fourcc),
+                                      self.fps,
+                                      (width, height))
+
+    def write(self, bgr):
+        self.writer.write(bgr)
+
+    def close(self):
+        self.writer.release()
+        LOGGER.debug(f'Saved {self.written} frames into {self.video_path}')
+
+
+display_sinks = dict(
+    null=NullSink,
+    snapshot=SnapshotSink,
+    mjpeg=MjpegSink,
+    video=VideoFileSink
+)
+
+
+def new_display_sink(shape):
+    """Create the sink given by CONF['display_sink']['name'].
+
+    Args:
+        shape (tuple): The shape of the frame, (height x width x 3).
+
+    Returns:
+        DisplaySink: The sink, it is the NullSink if the name is invalid.
+    """
+    name = CONF['display_sink']['name']
+
+    if name not in display_sinks:
+        LOGGER.error(f'Invalid display sink: {name}, use null instead')
+        name = 'null'
+
+    return display_sinks[name](shape)
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -20,30 +20,67 @@ Functions:
 # Requirements and constants
 import time
 import socket
+import struct
+
+from queue import SimpleQueue, Empty
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 from threading import Thread
 from datetime import datetime
 
 from . import LOGGER, CONF
-from .toolbox import matplotlib_to_opencv_image, uint8
-from .NeuroScanMessage import NeuroScanMessage
+from .toolbox import uint8
+from .ring_buffer import EEGRingBuffer
+from .trace_renderer import SweepRenderer, ColumnEnvelope, ChannelScaler
+from .render_scheduler import RenderScheduler, LatestFrameMailbox
+from .clock_sync import ClockSync, now_ns
+from .NeuroScanMessage import NeuroScanMessage, HEADER_STRUCT, unpack_header
 
 # %%
 
-# Use agg backend to make the fig rendering in the thread
-import seaborn as sns
-import matplotlib
-sns.set_theme()
-matplotlib.use('agg')
-
 # %% ---- 2023-07-24 ------------------------
 # Function and class
 
+# Length of CURRY channel info struct in bytes is 144, consider padding
+curry_channel_info_dtype = np.dtype(dict(
+    names=['channelId', 'chanLabel', 'chanType', 'deviceType', 'eegGroup',
+           'posX', 'posY', 'posZ', 'posStatus', 'bipolarRef', 'addScale',
+           'isDropDown', 'isNoFilter'],
+    formats=['<i4', 'S80', '<i4', '<i4', '<i4',
+             '<f8', '<f8', '<f8', '<i4', '<i4', '<f4',
+             '<i4', '<i4'],
+    offsets=[0, 4, 84, 88, 92,
+             96, 104, 112, 120, 124, 128,
+             132, 136],
+    itemsize=144
+))
+
 
 class Curry8EEGReceiver(object):
+    # The number of reusable body buffers,
+    # the unpacked data is the view of the buffer,
+    # the buffer is only taken by the queued package, the others reuse it,
+    # so the queued data is valid until the pool_size more packages are queued.
+    pool_size = 256
+    # The max number of the packages in the queue, it is less than the pool_size,
+    # so the queued package is never overwritten by the receiving,
+    # the new package is dropped if the queue is full.
+    queue_limit = 128
+    # Seconds to wait for the connection and the incoming package,
+    # the connection is restarted if the stream is silent for stream_timeout seconds.
+    connect_timeout = 5
+    stream_timeout = 5
+    # Exponential backoff between the reconnections, seconds
+    backoff_min = 0.5
+    backoff_max = 30
+    # TCP keepalive options, seconds
+    keepalive_idle = 10
+    keepalive_interval = 3
+    keepalive_count = 3
+    # The max bytes of the package body, the larger one refers the broken stream
+    max_packet_size = 16 * 1024 * 1024
+
     def __init__(self, channels, host, port, sample_rate):
         self.channels = channels
         self.host = host
@@ -52,56 +89,186 @@ class Curry8EEGReceiver(object):
 
         # package 是要发送的数据包
         self.package = None
+        self.message = NeuroScanMessage()
+        self.sock = None
+        # Whether the streaming is requested in the current session
+        self.streaming = False
+
+        # Preallocated buffers for the receiving
+        self.header_buffer = bytearray(HEADER_STRUCT.size)
+        self.header_view = memoryview(self.header_buffer)
+        self.body_pool = []
+        self.body_pool_idx = 0
+
+        # The expected startSample of the next package
+        self.next_sample = None
+        self.metrics = dict(
+            sessions=0,  # number of the established sessions
+            reconnects=0,  # number of the sessions after the first one
+            connect_failures=0,  # number of the failed connections or sessions
+            packages=0,  # number of the received EEG packages
+            lost_samples=0,  # samples missing in the startSample sequence
+            duplicated_samples=0,  # samples received more than once
+            dropped_packages=0,  # packages dropped since the queue is full
+        )
 
         LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
 
-        self.buffer = []
-        self.connect()
+        # The single-producer/single-consumer queue of the packages,
+        # the socket thread puts and the EEGDeviceReader gets.
+        self.buffer = SimpleQueue()
 
-    @LOGGER.catch
     def connect(self):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((self.host, self.port))
+        """Connect to the Curry8 server,
+        the socket is setup with TCP_NODELAY and TCP keepalive.
+
+        Raises:
+            OSError: The connection fails.
+        """
+        self.sock = socket.create_connection(
+            (self.host, self.port), timeout=self.connect_timeout)
+        self.sock.settimeout(self.stream_timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            self.sock.setsockopt(socket.IPPROTO_TCP,
+                                 socket.TCP_KEEPIDLE, self.keepalive_idle)
+            self.sock.setsockopt(socket.IPPROTO_TCP,
+                                 socket.TCP_KEEPINTVL, self.keepalive_interval)
+            self.sock.setsockopt(socket.IPPROTO_TCP,
+                                 socket.TCP_KEEPCNT, self.keepalive_count)
+        elif hasattr(socket, 'SIO_KEEPALIVE_VALS'):
+            self.sock.ioctl(socket.SIO_KEEPALIVE_VALS,
+                            (1, self.keepalive_idle * 1000, self.keepalive_interval * 1000))
+
         LOGGER.debug(f'Connect to {self.host}:{self.port}')
 
     def disconnect(self):
-        self.sock.shutdown(socket.SHUT_RDWR)
+        if self.sock is None:
+            return
+
+        if self.streaming:
+            self.stop_streaming()
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
         LOGGER.debug(f'Disconnect with {self.host}:{self.port}')
 
+    def start_session(self):
+        """Start the streaming session,
+        request the info and start the streaming once,
+        then the Curry8 sends the packages continuously.
+        """
+        # 请求获得基本信号：通道数目，采样率和数据包大小
+        self.requestInfo()
+        # 请求导联信息
+        self.requestChannelInfo()
+
+        LOGGER.debug('Request info finishes.')
+
+        self.start_streaming()
+
+    def start_streaming(self):
+        # 这只是一个指令，还需要端口发送
+        self.sock.sendall(self.message.startStreaming())
+        self.streaming = True
+        LOGGER.debug('Start streaming')
+
+    def stop_streaming(self):
+        self.streaming = False
+        try:
+            self.sock.sendall(self.message.stopStreaming())
+            LOGGER.debug('Stop streaming')
+        except OSError as err:
+            LOGGER.warning(f'Failed to stop streaming, {err}')
+
     def read_forever(self):
         self.running = True
         Thread(target=self._collect_packages, daemon=True).start()
         LOGGER.debug('Start collecting thread.')
 
-    def get(self):
-        return None if len(self.buffer) == 0 else self.buffer.pop(0)
+    def stop(self):
+        """Stop the collecting and close the session.
+        """
+        self.running = False
+        self.disconnect()
+
+    def get(self, block=False, timeout=None):
+        """Get the earliest package in the buffer.
+
+        Args:
+            block (bool, optional): Whether to wait for the package. Defaults to False.
+            timeout (float, optional): The seconds to wait for the package. Defaults to None.
+
+        Returns:
+            tuple: The package of (timestamp, data, startSample, arrival_ns), None if there is no package.
+        """
+        try:
+            return self.buffer.get(block, timeout)
+        except Empty:
+            return None
 
     def _collect_packages(self):
+        """Supervise the connection,
+        the session is restarted with exponential backoff when it fails,
+        the streaming is resubscribed by the new session.
+        """
         LOGGER.debug('Collecting packages')
 
-        # 请求获得基本信号：通道数目，采样率和数据包大小
-        self.requestInfo()
-        # 请求导联信息
-        self.requestChannelInfo()
-
-        LOGGER.debug('Request info finishes.')
+        backoff = self.backoff_min
 
         while self.running:
-            if not self.sock:
-                LOGGER.error(f'Cannot connect from {self.sock}')
-                break
+            try:
+                self.connect()
+                self.start_session()
 
-            # 这只是一个指令
-            sendStartStreaming = NeuroScanMessage().startStreaming()
-            # 还需要端口发送
-            self.sock.send(sendStartStreaming)
+                if self.metrics['sessions'] > 0:
+                    self.metrics['reconnects'] += 1
+                self.metrics['sessions'] += 1
+                backoff = self.backoff_min
 
+                self._stream_packages()
+
+            # Any error restarts the session, it requests the info again
+            except Exception as err:
+                if not self.running:
+                    break
+
+                self.metrics['connect_failures'] += 1
+                LOGGER.error(
+                    f'Curry8 session fails, {err}, reconnect in {backoff} seconds, {self.metrics}')
+
+                self.streaming = False
+                if self.sock is not None:
+                    self.sock.close()
+
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+
+        self.running = False
+        LOGGER.debug('Stop collecting packages')
+
+    def _stream_packages(self):
+        """Receive the packages in the session until it stops or fails.
+
+        Raises:
+            OSError: The connection fails.
+        """
+        while self.running:
             message, data = self.read_from_sock()
+            arrival_ns = now_ns()
+
+            # Only the EEG packages are collected, the events are ignored
+            if message['code'] != self.message.dataType['Data_Eeg']:
+                continue
 
-            # This == [0] means it is a trigger package
+            # This == 0 means it is a trigger package
             package_start_time_curry8_timestamp = message['startSample']
-            if package_start_time_curry8_timestamp == [0]:
+            if package_start_time_curry8_timestamp == 0:
                 continue
 
             t = time.time()
@@ -111,42 +278,145 @@ class Curry8EEGReceiver(object):
             if unpack_data is None:
                 continue
 
-            print('---------', t, type(unpack_data), unpack_data.shape)
-            self.buffer.append(
-                (t, unpack_data, package_start_time_curry8_timestamp))
+            self._check_continuity(
+                package_start_time_curry8_timestamp, unpack_data.shape[1])
 
-        self.running = False
-        LOGGER.debug('Stop collecting packages')
+            # One buffer is being received into, and one is held by the consumer
+            if self.buffer.qsize() >= min(self.queue_limit, self.pool_size - 2):
+                self.metrics['dropped_packages'] += 1
+                LOGGER.warning(
+                    f'The queue is full, drop the package at startSample {package_start_time_curry8_timestamp}, {self.metrics}')
+                continue
+
+            self.buffer.put(
+                (t, unpack_data, package_start_time_curry8_timestamp, arrival_ns))
+            self._take_body()
+
+    def _check_continuity(self, start_sample, n):
+        """Detect the gap in the startSample sequence.
+
+        Args:
+            start_sample (int): The startSample of the package;
+            n (int): The number of the samples in the package.
+        """
+        self.metrics['packages'] += 1
+
+        if self.next_sample is not None:
+            gap = start_sample - self.next_sample
+
+            # The startSample jumps backward by more than the package, Curry8 restarts
+            if -gap > n:
+                LOGGER.warning(
+                    f'The startSample restarts from {self.next_sample} to {start_sample}')
+                self.next_sample = None
+
+            elif gap > 0:
+                self.metrics['lost_samples'] += gap
+                LOGGER.warning(
+                    f'Lost {gap} samples before startSample {start_sample}, {self.metrics}')
+
+            elif gap < 0:
+                self.metrics['duplicated_samples'] += -gap
+                LOGGER.warning(
+                    f'Duplicated {-gap} samples at startSample {start_sample}, {self.metrics}')
+
+        if self.next_sample is None:
+            self.next_sample = start_sample + n
+        else:
+            self.next_sample = max(start_sample + n, self.next_sample)
 
     def read_from_sock(self):
+        """Read the package from the socket,
+        the header and body are received into the preallocated buffers.
+
+        Raises:
+            ConnectionError: The header is invalid, the stream is broken.
+
+        Returns:
+            dict: The parsed header;
+            memoryview: The body, it is the view of the buffer in the self.body_pool.
+        """
         # receive head
         # head size will always be 20
-
-        headSize = 20
-        head = self.sock.recv(headSize)
-        head = np.frombuffer(head, dtype=np.uint8)
+        self._recv_into(self.header_view)
 
         # receive body if header meets request
-        message = self._parseHeader(head)
+        message = self._parseHeader(self.header_buffer)
+
+        if message['charID'] not in (b'DATA', b'CTRL'):
+            raise ConnectionError(f'Invalid charID: {message["charID"]}')
 
-        data = self.sock.recv(message['packetSize'], socket.MSG_WAITALL)
-        data = np.frombuffer(data, dtype=np.uint8)
+        if message['packetSize'] > self.max_packet_size:
+            raise ConnectionError(
+                f'Invalid packetSize: {message["packetSize"]}')
+
+        data = self._next_body_view(message['packetSize'])
+        self._recv_into(data)
 
         return message, data
 
-    def _unpackEEG(self, data):
+    def allocate_body_pool(self, size):
+        """Allocate the reusable buffers for the body.
+
+        Args:
+            size (int): The bytes of each buffer, the buffer grows if the incoming body is larger.
+        """
+        self.body_pool = [bytearray(size) for _ in range(self.pool_size)]
+        self.body_pool_idx = 0
+        LOGGER.debug(f'Allocate {self.pool_size} x {size} bytes body pool')
 
-        # print('----------------------')
-        # print(data, len(data))
+    def _next_body_view(self, size):
+        if not self.body_pool:
+            self.allocate_body_pool(size)
+
+        j = self.body_pool_idx
+
+        if len(self.body_pool[j]) < size:
+            self.body_pool[j] = bytearray(size)
+
+        return memoryview(self.body_pool[j])[:size]
+
+    def _take_body(self):
+        """Take the current body buffer for the queued package,
+        the next package is received into the next buffer.
+        """
+        self.body_pool_idx = (self.body_pool_idx + 1) % len(self.body_pool)
+
+    def _recv_into(self, view):
+        """Receive exactly len(view) bytes into the view.
+
+        Args:
+            view (memoryview): The view of the buffer.
+
+        Raises:
+            ConnectionError: The connection is closed by the server.
+        """
+        n = len(view)
+        received = 0
+        while received < n:
+            k = self.sock.recv_into(view[received:], n - received)
+            if k == 0:
+                raise ConnectionError(
+                    f'Connection is closed by {self.host}:{self.port}')
+            received += k
+
+    def _unpackEEG(self, data):
 
         if self.info['datasize'] == 2:
-            data = data.view(np.int16)
+            packet = np.frombuffer(data, dtype='<i2')
 
         elif self.info['datasize'] == 4:
-            packet = data.view(np.single)
+            packet = np.frombuffer(data, dtype='<f4')
+
+        else:
+            return None
+
+        # The montage is changed, the session is restarted to request the info
+        if len(packet) % self.info['eegChan'] != 0:
+            raise ConnectionError(
+                f'Invalid EEG package: {len(packet)} values for {self.info["eegChan"]} channels')
 
         numSamples = int(len(packet)/self.info['eegChan'])
-        # print(packet, self.info)
         packet = np.reshape(
             packet, (self.info['eegChan'], numSamples), order='F')
 
@@ -154,86 +424,65 @@ class Curry8EEGReceiver(object):
 
     def _parseHeader(self, head):
         # parsing head
-
-        code = np.flip(head[4:6]).copy().view(dtype=np.uint16)
-        request = np.flip(head[6:8]).copy().view(np.uint16)
-        startSample = np.flip(head[8:12]).copy().view(np.uint32)
-        packetSize = np.flip(head[12:16]).copy().view(np.uint32)
-
-        return {
-            'code': code,
-            'request': request,
-            'startSample': startSample[0],
-            'packetSize': packetSize[0],
-        }
+        return unpack_header(head)
 
     def requestInfo(self):
         # 获得设置信息
 
-        sendBasicInfo = NeuroScanMessage().getBasicInfo()
+        sendBasicInfo = self.message.getBasicInfo()
 
-        self.sock.send(sendBasicInfo)
+        self.sock.sendall(sendBasicInfo)
 
         message, data = self.read_from_sock()
 
-        size = np.uint8(data[:4]).copy().view(dtype=np.uint32)
-        eegChan = np.uint8(data[4:8]).copy().view(np.uint32)
-        sampleRate = np.uint8(data[8:12]).copy().view(np.uint32)
-        datasize = np.uint8(data[12:16]).copy().view(np.uint32)
+        if len(data) < 16:
+            raise ConnectionError(f'Invalid basic info: {len(data)} bytes')
+
+        size, eegChan, sampleRate, datasize = struct.unpack_from('<4I', data)
 
         info = {
             'size': size,
-            'eegChan': int(eegChan),
+            'eegChan': eegChan,
             'sampleRate': sampleRate,
-            'datasize': datasize[0]
+            'datasize': datasize
         }
 
         self.info = info
         LOGGER.debug(f'Request info: {info}')
+
+        # The body pool is sized for the package of 1/10 second,
+        # it grows if the incoming package is larger.
+        self.allocate_body_pool(eegChan * datasize * max(sampleRate // 10, 1))
         return self
 
     def requestChannelInfo(self):
 
         # 获得设置信息
-        offset_channelId = 1
-        offset_chanLabel = offset_channelId + 4
-        offset_chanType = offset_chanLabel + 80
-        offset_deviceType = offset_chanType + 4
-        offset_eegGroup = offset_deviceType + 4
-        offset_posX = offset_eegGroup + 4
-        offset_posY = offset_posX + 8
-        offset_posZ = offset_posY + 8
-        offset_posStatus = offset_posZ + 8
-        offset_bipolarRef = offset_posStatus + 4
-        offset_addScale = offset_bipolarRef + 4
-        offset_isDropDown = offset_addScale + 4
-        offset_isNoFilter = offset_isDropDown + 4
-
-        # Raw length
-        chanInfoLen = (offset_isNoFilter + 4) - 1
-        # Length of CURRY channel info struct in bytes, consider padding
-        chanInfoLen = round(chanInfoLen/8)*8
-
         channelNUM = self.info['eegChan']
 
-        sendChannelInfo = NeuroScanMessage().getChannelInfo()
+        sendChannelInfo = self.message.getChannelInfo()
 
-        self.sock.send(sendChannelInfo)
+        self.sock.sendall(sendChannelInfo)
 
         message, data = self.read_from_sock()
 
-        channelLabels = []
-        for i in range(channelNUM):
-            j = chanInfoLen*i
+        if len(data) < channelNUM * curry_channel_info_dtype.itemsize:
+            raise ConnectionError(f'Invalid channel info: {len(data)} bytes')
 
-            label = data[j+offset_chanLabel-1:j+(offset_chanType-1)]
-            label = label[:6].tolist()
-            label = ''.join([chr(item) for item in label])
-            label = label.replace('\x00', '')
+        # Copy the channel info out of the reusable body buffer
+        channelInfo = np.frombuffer(
+            data, dtype=curry_channel_info_dtype, count=channelNUM).copy()
 
-            channelLabels.append(label)
+        # The label is the wide chars terminated by NUL, the bytes after it are not initialized,
+        # the field is padded back to its size, since numpy strips its trailing zero bytes
+        label_size = curry_channel_info_dtype['chanLabel'].itemsize
+        channelLabels = [label.ljust(label_size, b'\x00').decode('utf-16-le').split('\x00', 1)[0]
+                         for label in channelInfo['chanLabel']]
 
         self.info['channels'] = channelLabels
+        self.info['channelInfo'] = channelInfo
+        self.info['positions'] = np.stack(
+            [channelInfo['posX'], channelInfo['posY'], channelInfo['posZ']], axis=1)
 
         channelLabels = [f' {label}' for label in channelLabels]
         channelLabels = ''.join(channelLabels)
@@ -255,12 +504,15 @@ class EEGDeviceReader(object):
     package_length = 40  # number of time points per package
     packages_limit = 5000  # number of packages
     display_window_length = 2  # seconds
-    display_inch_width = 4  # inch
-    display_inch_height = 3  # inch
-    display_dpi = 100  # DPI
+    display_pixel_width = 400  # pixels
+    display_pixel_height = 300  # pixels
+    display_fps = 30  # the max frames per second of the panel
+    display_scale = 'minmax'  # 'minmax' or 'percentile', how to scale the channels
     host = '192.168.1.103'
     port = 4455
     package_interval = package_length / sample_rate  # Interval between packages
+    gap_fill = 'interpolate'  # 'nan' or 'interpolate', how to fill the lost samples
+    gap_interpolate_limit = 100  # samples, the longer gap is filled with NaN
 
     def __init__(self):
         self.conf_override()
@@ -290,8 +542,8 @@ class EEGDeviceReader(object):
         self.curry8_eeg_receiver.read_forever()
 
     def placeholder_image(self):
-        return uint8(np.zeros((self.display_inch_height*self.display_dpi,
-                               self.display_inch_width*self.display_dpi,
+        return uint8(np.zeros((self.display_pixel_height,
+                               self.display_pixel_width,
                                3)))
 
     def start(self):
@@ -303,17 +555,18 @@ class EEGDeviceReader(object):
     def stop(self):
         self.running = False
 
+        if hasattr(self, 'curry8_eeg_receiver'):
+            self.curry8_eeg_receiver.stop()
+
     def _read_data(self):
         """Simulate the EEG device reading,
         it is called by the self.run_forever() method.
         """
 
-        self.data_buffer = []
         self._read_data_idx = 0
 
         LOGGER.debug('Read data loop starts.')
         while self.running:
-            time.sleep(self.package_interval / 2)
             # t = time.time()
             # incoming = np.zeros((self.channels, self.package_length)) + t
 
@@ -323,113 +576,136 @@ class EEGDeviceReader(object):
 
             if not hasattr(self, 'curry8_eeg_receiver'):
                 LOGGER.warning('The curry8_eeg_receiver is not available')
+                time.sleep(self.package_interval / 2)
                 continue
 
-            # Read all the packages available
-            n = len(self.curry8_eeg_receiver.buffer)
-
-            for _ in range(n):
-                pair = self.curry8_eeg_receiver.get()
-                if pair is None:
-                    continue
-                t, incoming, package_start_time_curry8_timestamp = pair
+            # Wake up when the package arrives,
+            # the timeout is to check the self.running.
+            pair = self.curry8_eeg_receiver.get(
+                block=True, timeout=self.package_interval)
 
-                self.data_buffer.append((self._read_data_idx, t, incoming))
+            # Read all the packages available
+            while pair is not None:
+                t, incoming, package_start_time_curry8_timestamp, arrival_ns = pair
+
+                if incoming.shape[0] != self.data_buffer.channels:
+                    LOGGER.warning(
+                        f'Reset data buffer for {incoming.shape[0]} channels.')
+                    self.data_buffer = self.new_data_buffer(incoming.shape[0])
+
+                # The samples are keyed by the device sample index,
+                # the lost samples are filled and the duplicated samples are dropped.
+                self.data_buffer.append(self._read_data_idx, t, incoming,
+                                        start_sample=package_start_time_curry8_timestamp)
                 self._read_data_idx += 1
 
-            if self.get_data_buffer_size() > self.packages_limit:
-                LOGGER.warning(
-                    f'Data buffer exceeds {self.packages_limit} packages.')
-                self.data_buffer.pop(0)
+                # The package arrives after its last sample is sampled
+                self.clock_sync.update(
+                    package_start_time_curry8_timestamp + incoming.shape[1] - 1, arrival_ns)
 
-                # time.sleep(self.package_interval / 10)
+                self.render_scheduler.notify()
 
-        LOGGER.debug('Read data loop stops.')
+                pair = self.curry8_eeg_receiver.get()
 
-    def add_offset(self, data):
-        """Add offset to the channels of the array for display purposes
-        The operation is in-place.
+        LOGGER.debug('Read data loop stops.')
 
-        Args:
-            data (2d array): The data of EEG data, the shape is (channels x times)
+    def read_bgr(self):
+        """Read the latest rendered panel.
 
         Returns:
-            2d array: The data with offset
+            tuple: The (timestamp, bgr) of the panel, None if there is no new panel.
         """
-        for j, d in enumerate(data):
-            d -= np.min(d)
-            if np.max(d) != 0:
-                d /= np.max(d)
-            d += j
-        return data
+        return self.mailbox.take()
 
-    def read_bgr(self):
-        if len(self.bgr_list) < 1:
-            return None
+    def new_trace_renderer(self):
+        """Create the renderer for the channels' traces.
 
-        timestamp, bgr = self.bgr_list.pop(0)
+        Returns:
+            SweepRenderer: The renderer of the display size.
+        """
+        return SweepRenderer(width=self.display_pixel_width,
+                             height=self.display_pixel_height,
+                             window_length=self.display_window_length,
+                             y_range=(-1, self.data_buffer.channels + 1))
 
-        return timestamp, bgr
+    def new_envelope(self):
+        """Create the min and max envelopes of the channels per pixel column of the window.
 
-    def _plot_data(self):
-        """Plot the data,
-        it append the mpl fig into self.bgr_list.
+        Returns:
+            ColumnEnvelope: The empty envelopes.
+        """
+        return ColumnEnvelope(channels=self.data_buffer.channels,
+                              width=self.display_pixel_width,
+                              window_samples=int(self.display_window_length * self.sample_rate))
 
-        Args:
-            window_length (int, optional): How many seconds is the window. Defaults to 2#Seconds.
+    def _plot_data(self):
+        """Plot the data in the sweep mode,
+        it decimates and draws the samples arriving since the last frame, and puts the panel into self.mailbox.
         """
 
-        packages = int(self.display_window_length / self.package_interval)
-        self.bgr_list = []
+        data_buffer = self.data_buffer
+        renderer = self.new_trace_renderer()
+        envelope = self.new_envelope()
+        scaler = ChannelScaler(method=self.display_scale)
 
         LOGGER.debug('Plot data starts.')
 
         while self.running:
-            fetched = self.peek_latest_data_by_length(packages)
-            if fetched is None:
+            # Wake up when the new package arrives,
+            # the timeout is to check the self.running.
+            if not self.render_scheduler.wait(timeout=self.package_interval * 2):
                 continue
 
-            timestamp = fetched[-1][1]
-
-            fig, axe = plt.subplots(1, 1, figsize=(
-                self.display_inch_width, self.display_inch_height), dpi=self.display_dpi)
-
-            current_package = fetched[-1][0] % packages
-
-            if select := [
-                e[2] for e in fetched if (e[0] % packages) < current_package
-            ]:
-                d = np.concatenate(select, axis=1)
-                self.add_offset(d)
+            # The data buffer is reset
+            if data_buffer is not self.data_buffer:
+                data_buffer = self.data_buffer
+                renderer = self.new_trace_renderer()
+                envelope = self.new_envelope()
+                scaler = ChannelScaler(method=self.display_scale)
+
+            # Draw the latest window at the first frame
+            if envelope.written is None:
+                since = data_buffer.samples_written - envelope.window_samples
+            else:
+                since = envelope.written
+
+            data, start = data_buffer.peek_since(since)
+            if data.shape[1] < 1:
+                continue
 
-                t = np.linspace(
-                    0, d.shape[1]/self.sample_rate, d.shape[1], endpoint=False)
+            # Decimate the samples into the columns
+            columns = envelope.update(data, start)
 
-                axe.plot(t, d.transpose())
+            # The channels are scaled by the latest window
+            d = scaler(envelope.points(columns),
+                       reference=envelope.window_points())
 
-            if select := [
-                e[2] for e in fetched if (e[0] % packages) > current_package
-            ]:
-                d = np.concatenate(select, axis=1)
-                self.add_offset(d)
+            renderer.update(d, columns)
 
-                t = np.linspace(
-                    self.display_window_length-d.shape[1]/self.sample_rate, self.display_window_length, d.shape[1], endpoint=False)
+            timestamp = data_buffer.latest_timestamp()
 
-                axe.plot(t, d.transpose(), linewidth=0.5)
+            # The canvas is kept by the renderer
+            bgr = renderer.snapshot(
+                str(datetime.fromtimestamp(timestamp).today()))
 
-            # Setup axe
-            axe.set_xlim(0, self.display_window_length)
+            self.mailbox.put(timestamp, bgr)
 
-            axe.set_title(
-                str(datetime.fromtimestamp(timestamp).today()))
+        LOGGER.debug('Plot data stops.')
 
-            # Convert the bgr into the opencv-image
-            bgr = matplotlib_to_opencv_image(fig)
+    def new_data_buffer(self, channels=None):
+        """Create the fixed-capacity ring buffer for the packages.
 
-            self.bgr_list.append((timestamp, bgr))
+        Args:
+            channels (int, optional): The number of channels. Defaults to self.channels.
 
-        LOGGER.debug('Plot data stops.')
+        Returns:
+            EEGRingBuffer: The empty ring buffer.
+        """
+        return EEGRingBuffer(channels=channels or self.channels,
+                             package_length=self.package_length,
+                             packages_limit=self.packages_limit,
+                             gap_fill=self.gap_fill,
+                             max_interpolate=self.gap_interpolate_limit)
 
     def get_data_buffer_size(self):
         """Get the current buffer size for the data_buffer
@@ -461,38 +737,69 @@ class EEGDeviceReader(object):
         if n < length:
             LOGGER.warning(f'Can not peek data with {length} samples.')
 
-        return list(self.data_buffer[-length:].copy())
+        return self.data_buffer.peek_latest_packages(length)
 
-    def peek_latest_data_by_milliseconds(self, milliseconds=1000):
+    def peek_latest_data_by_milliseconds(self, milliseconds=1000, end_ns=None):
         """Peek the latest data available for given milliseconds.
 
         Args:
             milliseconds (int, optional): The milliseconds being required. Defaults to 1000.
+            end_ns (int, optional): The aligned host time of the window's end, see ClockSync. Defaults to None, refers the latest sample.
 
         Returns:
-            np.array: The (64 x n) array, the n refers the samples and the 3 refers the channels, the order is given in self.channels_colors.
+            np.array: The (64 x n) array, the n refers the samples and the 64 refers the channels.
+            It is the read-only view of the data buffer if it is not wrapped.
+            None if there are less than n samples, or the samples at end_ns have not arrived.
         """
-        num_packages = int(milliseconds / 1000 *
-                           self.sample_rate / self.package_length) + 1
-
         n = int(milliseconds / 1000 * self.sample_rate)
 
-        packages = self.peek_latest_data_by_length(num_packages)
+        if end_ns is not None:
+            return self.peek_data_by_host_time(end_ns, n)
 
-        if packages is None:
+        if self.data_buffer.samples_available() < n:
             LOGGER.error(
-                f'Failed peek_latest_data_by_length with {milliseconds}')
+                f'Failed peek_latest_data_by_milliseconds with {milliseconds}')
+            return None
+
+        return self.data_buffer.peek_latest_samples(n)
+
+    def peek_data_by_host_time(self, end_ns, n):
+        """Peek the n samples ending at the aligned host time.
+
+        Args:
+            end_ns (int): The aligned host time of the last sample;
+            n (int): How many samples are required.
+
+        Returns:
+            np.array: The (64 x n) array, None if the samples are not available.
+        """
+        end_sample = self.clock_sync.to_counter(end_ns)
+
+        latest_sample = self.data_buffer.latest_sample()
+
+        # The samples have not arrived
+        if end_sample is None or latest_sample is None or end_sample > latest_sample:
             return None
 
-        return np.concatenate([e[2] for e in packages], axis=1)[:, -n:]
+        data = self.data_buffer.peek_samples(end_sample, n)
+
+        if data is None:
+            LOGGER.error(f'Failed peek_data_by_host_time with {end_ns}')
+
+        return data
 
     def run_forever(self):
         """Run the loops forever.
         """
         self.running = True
+        self.data_buffer = self.new_data_buffer()
+        self.render_scheduler = RenderScheduler(self.display_fps)
+        self.mailbox = LatestFrameMailbox()
+        self.clock_sync = ClockSync(self.sample_rate, name='EEG')
+        # The receiver connects in its own thread, so it is not blocking
+        self.connect()
         Thread(target=self._read_data, daemon=True).start()
         Thread(target=self._plot_data, daemon=True).start()
-        Thread(target=self.connect, daemon=True).start()
 
 
 # %% ---- 2023-07-24 ------------------------
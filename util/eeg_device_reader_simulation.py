@@ -21,22 +21,18 @@ Functions:
 import time
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 from threading import Thread
-from datetime import datetime
 
 from . import LOGGER, CONF
-from .toolbox import matplotlib_to_opencv_image, uint8
+from .toolbox import uint8
+from .ring_buffer import EEGRingBuffer
+from .trace_renderer import SweepRenderer, ColumnEnvelope, ChannelScaler
+from .render_scheduler import RenderScheduler, LatestFrameMailbox
+from .clock_sync import ClockSync, now_ns
 
 # %%
 
-# Use agg backend to make the fig rendering in the thread
-import seaborn as sns
-import matplotlib
-sns.set_theme()
-matplotlib.use('agg')
-
 # %% ---- 2023-07-24 ------------------------
 # Function and class
 
@@ -55,8 +51,11 @@ class EEGDeviceReader(object):
     display_window_length = 2  # seconds
     display_pixel_width = 400  # pixels
     display_pixel_height = 300  # pixels
-    display_dpi = 100  # DPI
+    display_fps = 30  # the max frames per second of the panel
+    display_scale = 'minmax'  # 'minmax' or 'percentile', how to scale the channels
     package_interval = package_length / sample_rate  # Interval between packages
+    gap_fill = 'interpolate'  # 'nan' or 'interpolate', how to fill the lost samples
+    gap_interpolate_limit = 100  # samples, the longer gap is filled with NaN
 
     def __init__(self):
         self.conf_override()
@@ -95,111 +94,130 @@ class EEGDeviceReader(object):
         it is called by the self.run_forever() method.
         """
 
-        self.data_buffer = []
         self._read_data_idx = 0
 
         LOGGER.debug('Read data loop starts.')
         while self.running:
             t = time.time()
+            arrival_ns = now_ns()
             incoming = np.zeros((self.channels, self.package_length)) + t
 
             for j in range(self.package_length):
                 incoming[:, j] += j / self.sample_rate
                 incoming[:, j] %= 1
 
-            self.data_buffer.append((self._read_data_idx, t, incoming))
+            # Simulate the device sample index
+            start_sample = self._read_data_idx * self.package_length
+            self.data_buffer.append(self._read_data_idx, t, incoming,
+                                    start_sample=start_sample)
             self._read_data_idx += 1
 
-            if self.get_data_buffer_size() > self.packages_limit:
-                LOGGER.warning(
-                    f'Data buffer exceeds {self.packages_limit} packages.')
-                self.data_buffer.pop(0)
+            self.clock_sync.update(
+                start_sample + self.package_length - 1, arrival_ns)
+
+            self.render_scheduler.notify()
 
             time.sleep(self.package_interval)
 
         LOGGER.debug('Read data loop stops.')
 
-    def add_offset(self, data):
-        """Add offset to the channels of the array for display purposes
-        The operation is in-place.
-
-        Args:
-            data (2d array): The data of EEG data, the shape is (channels x times)
+    def read_bgr(self):
+        """Read the latest rendered panel.
 
         Returns:
-            2d array: The data with offset
+            tuple: The (timestamp, bgr) of the panel, None if there is no new panel.
         """
-        for j, d in enumerate(data):
-            d += j
-        return data
+        return self.mailbox.take()
 
-    def read_bgr(self):
-        if len(self.bgr_list) < 1:
-            return None
+    def new_trace_renderer(self):
+        """Create the renderer for the channels' traces.
+
+        Returns:
+            SweepRenderer: The renderer of the display size.
+        """
+        return SweepRenderer(width=self.display_pixel_width,
+                             height=self.display_pixel_height,
+                             window_length=self.display_window_length,
+                             y_range=(-1, self.data_buffer.channels + 1))
 
-        timestamp, bgr = self.bgr_list.pop(0)
+    def new_envelope(self):
+        """Create the min and max envelopes of the channels per pixel column of the window.
 
-        return timestamp, bgr
+        Returns:
+            ColumnEnvelope: The empty envelopes.
+        """
+        return ColumnEnvelope(channels=self.data_buffer.channels,
+                              width=self.display_pixel_width,
+                              window_samples=int(self.display_window_length * self.sample_rate))
 
     def _plot_data(self):
-        """Plot the data,
-        it append the mpl fig into self.bgr_list.
+        """Plot the data in the sweep mode,
+        it decimates and draws the samples arriving since the last frame, and puts the panel into self.mailbox.
         """
 
-        packages = int(self.display_window_length / self.package_interval)
-        self.bgr_list = []
+        data_buffer = self.data_buffer
+        renderer = self.new_trace_renderer()
+        envelope = self.new_envelope()
+        scaler = ChannelScaler(method=self.display_scale)
 
         LOGGER.debug('Plot data starts.')
 
         while self.running:
-            fetched = self.peek_latest_data_by_length(packages)
-            if fetched is None:
+            # Wake up when the new package arrives,
+            # the timeout is to check the self.running.
+            if not self.render_scheduler.wait(timeout=self.package_interval * 2):
                 continue
 
-            timestamp = fetched[-1][1]
-
-            plt.style.use('seaborn')
-            fig, axe = plt.subplots(1, 1, figsize=(
-                self.display_pixel_width/self.display_dpi, self.display_pixel_height/self.display_dpi), dpi=self.display_dpi)
-
-            current_package = fetched[-1][0] % packages
-
-            if select := [
-                e[2] for e in fetched if (e[0] % packages) < current_package
-            ]:
-                d = np.concatenate(select, axis=1)
-                self.add_offset(d)
-
-                t = np.linspace(
-                    0, d.shape[1]/self.sample_rate, d.shape[1], endpoint=False)
-
-                axe.plot(t, d.transpose())
+            # The data buffer is reset
+            if data_buffer is not self.data_buffer:
+                data_buffer = self.data_buffer
+                renderer = self.new_trace_renderer()
+                envelope = self.new_envelope()
+                scaler = ChannelScaler(method=self.display_scale)
+
+            # Draw the latest window at the first frame
+            if envelope.written is None:
+                since = data_buffer.samples_written - envelope.window_samples
+            else:
+                since = envelope.written
+
+            data, start = data_buffer.peek_since(since)
+            if data.shape[1] < 1:
+                continue
 
-            if select := [
-                e[2] for e in fetched if (e[0] % packages) > current_package
-            ]:
-                d = np.concatenate(select, axis=1)
-                self.add_offset(d)
+            # Decimate the samples into the columns
+            columns = envelope.update(data, start)
 
-                t = np.linspace(
-                    self.display_window_length-d.shape[1]/self.sample_rate, self.display_window_length, d.shape[1], endpoint=False)
+            # The channels are scaled by the latest window
+            d = scaler(envelope.points(columns),
+                       reference=envelope.window_points())
 
-                axe.plot(t, d.transpose(), linewidth=0.5)
+            renderer.update(d, columns)
 
-            # Setup axe
-            axe.set_xlim(0, self.display_window_length)
+            timestamp = data_buffer.latest_timestamp()
 
-            axe.set_title(
+            # The canvas is kept by the renderer
+            bgr = renderer.snapshot(
                 f'EEG x64 (Simulation) {self.get_data_buffer_size()} | {self.packages_limit}')
 
-            fig.tight_layout()
+            self.mailbox.put(timestamp, bgr)
 
-            # Convert the bgr into the opencv-image
-            bgr = matplotlib_to_opencv_image(fig)
+        LOGGER.debug('Plot data stops.')
 
-            self.bgr_list.append((timestamp, bgr))
+    def new_data_buffer(self, channels=None):
+        """Create the fixed-capacity ring buffer for the packages.
 
-        LOGGER.debug('Plot data stops.')
+        Args:
+            channels (int, optional): The number of channels. Defaults to self.channels.
+
+        Returns:
+            EEGRingBuffer: The empty ring buffer.
+        """
+        return EEGRingBuffer(channels=channels or self.channels,
+                             package_length=self.package_length,
+                             packages_limit=self.packages_limit,
+                             gap_fill=self.gap_fill,
+                             max_interpolate=self.gap_interpolate_limit)
 
     def get_data_buffer_size(self):
         """Get the current buffer size for the data_buffer
@@ -231,35 +249,65 @@ class EEGDeviceReader(object):
         if n < length:
             LOGGER.warning(f'Can not peek data with {length} samples.')
 
-        return list(self.data_buffer[-length:].copy())
+        return self.data_buffer.peek_latest_packages(length)
 
-    def peek_latest_data_by_milliseconds(self, milliseconds=1000):
+    def peek_latest_data_by_milliseconds(self, milliseconds=1000, end_ns=None):
         """Peek the latest data available for given milliseconds.
 
         Args:
             milliseconds (int, optional): The milliseconds being required. Defaults to 1000.
+            end_ns (int, optional): The aligned host time of the window's end, see ClockSync. Defaults to None, refers the latest sample.
 
         Returns:
-            np.array: The (64 x n) array, the n refers the samples and the 3 refers the channels, the order is given in self.channels_colors.
+            np.array: The (64 x n) array, the n refers the samples and the 64 refers the channels.
+            It is the read-only view of the data buffer if it is not wrapped.
+            None if there are less than n samples, or the samples at end_ns have not arrived.
         """
-        num_packages = int(milliseconds / 1000 *
-                           self.sample_rate / self.package_length) + 1
-
         n = int(milliseconds / 1000 * self.sample_rate)
 
-        packages = self.peek_latest_data_by_length(num_packages)
+        if end_ns is not None:
+            return self.peek_data_by_host_time(end_ns, n)
 
-        if packages is None:
+        if self.data_buffer.samples_available() < n:
             LOGGER.error(
-                f'Failed peek_latest_data_by_length with {milliseconds}')
+                f'Failed peek_latest_data_by_milliseconds with {milliseconds}')
             return None
 
-        return np.concatenate([e[2] for e in packages], axis=1)[:, -n:]
+        return self.data_buffer.peek_latest_samples(n)
+
+    def peek_data_by_host_time(self, end_ns, n):
+        """Peek the n samples ending at the aligned host time.
+
+        Args:
+            end_ns (int): The aligned host time of the last sample;
+            n (int): How many samples are required.
+
+        Returns:
+            np.array: The (64 x n) array, None if the samples are not available.
+        """
+        end_sample = self.clock_sync.to_counter(end_ns)
+
+        latest_sample = self.data_buffer.latest_sample()
+
+        # The samples have not arrived
+        if end_sample is None or latest_sample is None or end_sample > latest_sample:
+            return None
+
+        data = self.data_buffer.peek_samples(end_sample, n)
+
+        if data is None:
+            LOGGER.error(f'Failed peek_data_by_host_time with {end_ns}')
+
+        return data
 
     def run_forever(self):
         """Run the loops forever.
         """
         self.running = True
+        self.data_buffer = self.new_data_buffer()
+        self.render_scheduler = RenderScheduler(self.display_fps)
+        self.mailbox = LatestFrameMailbox()
+        self.clock_sync = ClockSync(self.sample_rate, name='EEG')
         Thread(target=self._read_data, daemon=True).start()
         Thread(target=self._plot_data, daemon=True).start()
         return
@@ -31,9 +31,12 @@ from .toolbox import uint8
 class MainWindow(object):
     """The big picture of the main window
 
+    The regions of the panels are computed and validated once in the initialization,
+    the panel is copied into the screen only if its frame sequence number is changed,
+    and the changed regions are recorded as the dirty rectangles for the display.
     """
-    width = 1200,  # px, window widthSTM32DeviceReader
-    height = 800,  # px, window height
+    width = 1200  # px, window width
+    height = 800  # px, window height
     video_panel_x = 10  # px, offset x of video panel
     video_panel_y = 10  # px, offset y of video panel
     eeg_panel_x = 500  # px, offset x of eeg panel
@@ -43,13 +46,22 @@ class MainWindow(object):
     decoder_panel_x = 10  # px, offset x of decoder panel
     decoder_panel_y = 620  # px, offset y of decoder panel
 
+    # The panels and their (CONF section, width key, height key) of the size
+    panel_sizes = dict(
+        video=('video', 'display_width', 'display_height'),
+        eeg=('eeg', 'display_pixel_width', 'display_pixel_height'),
+        stm32=('stm32', 'display_pixel_width', 'display_pixel_height'),
+        decoder=('decoder', 'display_pixel_width', 'display_pixel_height'),
+    )
+
     def __init__(self):
-        """Initialize the background.
+        """Initialize the layout and the background.
         """
         self.conf_override()
 
         LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
 
+        self.layout()
         self.reset_background()
 
     def conf_override(self):
@@ -61,6 +73,40 @@ class MainWindow(object):
 
         LOGGER.debug('Override the options with CONF')
 
+    def layout(self):
+        """Compute the regions of the panels clipped by the window,
+        the panel out of the window is disabled,
+        and the clipped or overlapped panel is warned.
+        """
+        self.regions = {}
+        for name, (section, width_key, height_key) in self.panel_sizes.items():
+            x = getattr(self, f'{name}_panel_x')
+            y = getattr(self, f'{name}_panel_y')
+            width = CONF[section][width_key]
+            height = CONF[section][height_key]
+
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                LOGGER.error(
+                    f'The {name} panel at ({x}, {y}) is out of the window, {self.width} x {self.height}')
+                continue
+
+            if x + width > self.width or y + height > self.height:
+                LOGGER.warning(
+                    f'The {name} panel of {width} x {height} at ({x}, {y}) exceeds the window, {self.width} x {self.height}')
+
+            self.regions[name] = (x, y,
+                                  min(width, self.width - x),
+                                  min(height, self.height - y))
+
+        names = list(self.regions)
+        for j, name in enumerate(names):
+            for other in names[j+1:]:
+                if overlapped(self.regions[name], self.regions[other]):
+                    LOGGER.warning(
+                        f'The {name} panel overlaps the {other} panel')
+
+        LOGGER.debug(f'Layout the panels in {self.regions}')
+
     def reset_background(self):
         """Reset the background with black bgr.
 
@@ -69,21 +115,51 @@ class MainWindow(object):
         """
         zero_bgr = uint8(np.zeros((self.height, self.width, 3)) + 50)
         self.screen_bgr = zero_bgr
+        self.seqs = {}
+        self.dirty_rects = [(0, 0, self.width, self.height)]
 
         LOGGER.debug(f'Generate black background with {zero_bgr.shape} array')
         return zero_bgr
 
-    def overlay_video_panel(self, bgr):
-        self.overlay_bgr(bgr, x=self.video_panel_x, y=self.video_panel_y)
+    def overlay_video_panel(self, bgr, seq=None):
+        self.overlay_panel('video', bgr, seq)
 
-    def overlay_eeg_panel(self, bgr):
-        self.overlay_bgr(bgr, x=self.eeg_panel_x, y=self.eeg_panel_y)
+    def overlay_eeg_panel(self, bgr, seq=None):
+        self.overlay_panel('eeg', bgr, seq)
 
-    def overlay_stm32_panel(self, bgr):
-        self.overlay_bgr(bgr, x=self.stm32_panel_x, y=self.stm32_panel_y)
+    def overlay_stm32_panel(self, bgr, seq=None):
+        self.overlay_panel('stm32', bgr, seq)
 
-    def overlay_decoder_panel(self, bgr):
-        self.overlay_bgr(bgr, x=self.decoder_panel_x, y=self.decoder_panel_y)
+    def overlay_decoder_panel(self, bgr, seq=None):
+        self.overlay_panel('decoder', bgr, seq)
+
+    def overlay_panel(self, name, bgr, seq=None):
+        """Overlay the panel to the background,
+        it is skipped if the seq is the same as the panel's latest one.
+
+        Args:
+            name (str): The name of the panel, see self.panel_sizes;
+            bgr (opencv image): The image of the panel;
+            seq (int, optional): The frame sequence number of the image. Defaults to None, refers the image is always new.
+
+        Returns:
+            opencv image: The updated background image.
+        """
+        if name not in self.regions:
+            return self.screen_bgr
+
+        if seq is not None:
+            if self.seqs.get(name) == seq:
+                return self.screen_bgr
+            self.seqs[name] = seq
+
+        x, y, width, height = self.regions[name]
+        height = min(height, bgr.shape[0])
+        width = min(width, bgr.shape[1])
+
+        self.screen_bgr[y:y+height, x:x+width] = bgr[:height, :width]
+        self.dirty_rects.append((x, y, width, height))
+        return self.screen_bgr
 
     def overlay_bgr(self, bgr, x=0, y=0):
         """Overlay to the background
@@ -96,24 +172,46 @@ class MainWindow(object):
         Returns:
             opencv image: The updated background image.
         """
+        height = max(min(bgr.shape[0], self.height - y), 0)
+        width = max(min(bgr.shape[1], self.width - x), 0)
 
-        shape = bgr.shape
-
-        if y + shape[0] > self.height:
-            bgr = bgr[:self.height - y]
+        if height < bgr.shape[0]:
             LOGGER.warning(
-                f'Overlay exceeds the height range, {y + shape[0]} | {self.height}'
+                f'Overlay exceeds the height range, {y + bgr.shape[0]} | {self.height}'
             )
 
-        if x + shape[1] > self.width:
-            bgr = bgr[:, :self.width - x]
+        if width < bgr.shape[1]:
             LOGGER.warning(
-                f'Overlay exceeds the width range, {x + shape[1]} | {self.width}'
+                f'Overlay exceeds the width range, {x + bgr.shape[1]} | {self.width}'
             )
 
-        self.screen_bgr[y:y+shape[0], x:x+shape[1]] = bgr
+        self.screen_bgr[y:y+height, x:x+width] = bgr[:height, :width]
+        self.dirty_rects.append((x, y, width, height))
         return self.screen_bgr
 
+    def take_dirty_rects(self):
+        """Take the regions changed since the last taking.
+
+        Returns:
+            list: The (x, y, width, height) of the changed regions.
+        """
+        dirty_rects, self.dirty_rects = self.dirty_rects, []
+        return dirty_rects
+
+
+def overlapped(a, b):
+    """Whether the regions are overlapped.
+
+    Args:
+        a (tuple): The (x, y, width, height) of the region;
+        b (tuple): The (x, y, width, height) of the other region.
+
+    Returns:
+        bool: Whether they are overlapped.
+    """
+    return (a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and
+            a[1] < b[1] + b[3] and b[1] < a[1] + a[3])
+
 # %% ---- 2023-07-25 ------------------------
 # Play ground
 
@@ -0,0 +1,115 @@
+"""
+File: render_scheduler.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Schedule the rendering of the panels
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import time
+
+from threading import Event, Lock
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class LatestFrameMailbox(object):
+    '''
+    Single-slot mailbox of the rendered frames.
+
+    The put overwrites the frame not being taken, so only the latest frame is kept,
+    and the taken frame is removed from the mailbox.
+    '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.frame = None
+        self.dropped_frames = 0
+
+    def put(self, timestamp, bgr):
+        """Put the frame into the mailbox, the stale frame is dropped.
+
+        Args:
+            timestamp (float): The timestamp of the frame;
+            bgr (np.array): The frame.
+        """
+        with self.lock:
+            if self.frame is not None:
+                self.dropped_frames += 1
+            self.frame = (timestamp, bgr)
+
+    def take(self):
+        """Take the latest frame.
+
+        Returns:
+            tuple: The (timestamp, bgr) of the frame, None if there is no new frame.
+        """
+        with self.lock:
+            frame, self.frame = self.frame, None
+        return frame
+
+
+class RenderScheduler(object):
+    '''
+    Wake the render loop when the new data arrives, at most fps times per second.
+
+    The data reader calls notify() after the data is appended,
+    and the render loop calls wait() before rendering.
+    '''
+
+    def __init__(self, fps):
+        self.interval = 1 / fps
+        self.event = Event()
+        self.rendered = 0
+
+    def notify(self):
+        """Notify the new data arrives.
+        """
+        self.event.set()
+
+    def wait(self, timeout=None):
+        """Wait for the new data, and keep the rendering rate not higher than the fps.
+
+        Args:
+            timeout (float, optional): The seconds to wait for the new data. Defaults to None, refers waiting forever.
+
+        Returns:
+            bool: Whether the new data arrives.
+        """
+        if not self.event.wait(timeout):
+            return False
+
+        delay = self.rendered + self.interval - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+        # The data arriving in the delay is rendered together
+        self.event.clear()
+        self.rendered = time.time()
+        return True
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
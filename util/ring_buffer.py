@@ -0,0 +1,403 @@
+"""
+File: ring_buffer.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Fixed-capacity ring buffers for the device readers
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import numpy as np
+
+from threading import Lock
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class EEGRingBuffer(object):
+    '''
+    Fixed-capacity ring buffer for the EEG packages.
+
+    The samples are stored channel-major in the preallocated (channels x capacity) array,
+    the capacity is package_length x packages_limit samples.
+    The packages are recorded in the parallel arrays of idx, timestamp, start and length,
+    the start refers the position of the package's first sample in the written samples.
+
+    The single writer appends the packages, and the readers peek the latest samples,
+    the peeked data is a read-only view if it is not wrapped, otherwise it is the concatenation of the two slices.
+
+    If the packages are appended with the device sample index,
+    the written samples are keyed by it, the duplicated samples are dropped,
+    and the lost samples are filled with NaN ('nan') or linear interpolation ('interpolate'),
+    the gap longer than max_interpolate samples is always filled with NaN.
+    The index jumping backward by more than the package or the capacity refers the device restarts,
+    and the written samples are keyed by the new index.
+    '''
+
+    def __init__(self, channels, package_length, packages_limit, dtype=np.float32, gap_fill='interpolate', max_interpolate=100):
+        self.channels = channels
+        self.package_length = package_length
+        self.packages_limit = packages_limit
+        self.capacity = package_length * packages_limit
+        self.gap_fill = gap_fill
+        self.max_interpolate = max_interpolate
+
+        self.data = np.zeros((channels, self.capacity), dtype=dtype)
+
+        self.package_idx = np.zeros(packages_limit, dtype=np.int64)
+        self.package_timestamp = np.zeros(packages_limit, dtype=np.float64)
+        self.package_start = np.zeros(packages_limit, dtype=np.int64)
+        self.package_size = np.zeros(packages_limit, dtype=np.int64)
+
+        self.samples_written = 0
+        self.packages_written = 0
+        self.lock = Lock()
+
+        # The device sample index of the first written sample
+        self.sample_offset = None
+        self.filled_samples = 0
+        self.dropped_samples = 0
+        self.restarts = 0
+
+    def __len__(self):
+        return len(self._latest_slots(self.packages_limit))
+
+    def append(self, idx, timestamp, data, start_sample=None):
+        """Append the package into the buffer.
+
+        Args:
+            idx (int): The index of the package;
+            timestamp (float): The timestamp of the package;
+            data (2d array): The package data, the shape is (channels x times);
+            start_sample (int, optional): The device sample index of the package's first sample. Defaults to None.
+        """
+        if start_sample is not None:
+            data = self._align(start_sample, data)
+            if data is None:
+                return
+
+        data = data[:, -self.capacity:]
+        n = data.shape[1]
+
+        start = self.samples_written
+        self._write(start, data)
+
+        with self.lock:
+            slot = self.packages_written % self.packages_limit
+            self.package_idx[slot] = idx
+            self.package_timestamp[slot] = timestamp
+            self.package_start[slot] = start
+            self.package_size[slot] = n
+
+            self.samples_written += n
+            self.packages_written += 1
+
+    def latest_timestamp(self):
+        """The timestamp of the latest package.
+
+        Returns:
+            float: The timestamp, None if there is no package.
+        """
+        with self.lock:
+            if self.packages_written == 0:
+                return None
+            return float(self.package_timestamp[(self.packages_written - 1) % self.packages_limit])
+
+    def latest_sample(self):
+        """The device sample index of the latest sample.
+
+        Returns:
+            int: The sample index, None if the packages are not keyed by the device sample index.
+        """
+        if self.sample_offset is None:
+            return None
+        return self.sample_offset + self.samples_written - 1
+
+    def samples_available(self):
+        """The number of the samples available in the buffer.
+
+        Returns:
+            int: The number of the samples.
+        """
+        return min(self.samples_written, self.capacity)
+
+    def peek_latest_samples(self, n):
+        """Peek the latest n samples.
+
+        Args:
+            n (int): How many samples are required.
+
+        Returns:
+            2d array: The (channels x n) array, it is shorter than n if there are not enough samples.
+        """
+        with self.lock:
+            n = min(n, self.samples_available())
+            start = self.samples_written - n
+
+        return self._read(start, n)
+
+    def peek_samples(self, end_sample, n):
+        """Peek the n samples ending at the device sample index.
+
+        Args:
+            end_sample (int): The device sample index of the last sample;
+            n (int): How many samples are required.
+
+        Returns:
+            2d array: The (channels x n) array, None if the samples are not in the buffer.
+        """
+        with self.lock:
+            if self.sample_offset is None:
+                return None
+
+            end = end_sample - self.sample_offset + 1
+            start = end - n
+            if start < self.samples_written - self.capacity or end > self.samples_written:
+                return None
+
+        return self._read(start, n)
+
+    def peek_since(self, start):
+        """Peek the samples written since the start-th written sample,
+        the samples being overwritten are skipped.
+
+        Args:
+            start (int): The position of the first sample in the written samples.
+
+        Returns:
+            tuple: The (channels x n) array and the position of its first sample.
+        """
+        with self.lock:
+            end = self.samples_written
+            start = min(max(start, end - self.capacity, 0), end)
+
+        return self._read(start, end - start), start
+
+    def peek_latest_packages(self, length):
+        """Peek the latest packages.
+
+        Args:
+            length (int): How many packages are required.
+
+        Returns:
+            list: The elements of the list are (idx, timestamp, data of (channels x package_length)).
+        """
+        with self.lock:
+            slots = self._latest_slots(length)
+            packages = [(self.package_idx[j],
+                         self.package_timestamp[j],
+                         self.package_start[j],
+                         self.package_size[j]) for j in slots]
+
+        return [(int(idx), float(timestamp), self._read(start, size))
+                for idx, timestamp, start, size in packages]
+
+    def _latest_slots(self, length):
+        """The slots of the latest packages, the overwritten packages are excluded.
+        """
+        count = min(length, self.packages_written, self.packages_limit)
+        slots = np.arange(self.packages_written - count,
+                          self.packages_written) % self.packages_limit
+        return slots[self.package_start[slots] >= self.samples_written - self.capacity]
+
+    def _align(self, start_sample, data):
+        """Align the package to the device sample index,
+        fill the gap before the package and drop the duplicated samples.
+
+        Returns:
+            2d array: The samples to write, None if all the samples are duplicated.
+        """
+        if self.sample_offset is None:
+            self.sample_offset = start_sample - self.samples_written
+            return data
+
+        n = data.shape[1]
+        gap = start_sample - (self.sample_offset + self.samples_written)
+
+        # The device restarts, the package follows the written samples
+        if -gap > n or -gap > self.capacity:
+            with self.lock:
+                self.sample_offset = start_sample - self.samples_written
+            self.restarts += 1
+            return data
+
+        if gap < 0:
+            self.dropped_samples += min(-gap, n)
+            return data[:, -gap:] if -gap < n else None
+
+        if gap > 0:
+            # Only the latest capacity samples of the gap are kept
+            filled = min(gap, self.capacity)
+            self._fill_gap(gap, filled, data[:, 0])
+
+            with self.lock:
+                self.sample_offset += gap - filled
+                self.samples_written += filled
+            self.filled_samples += gap
+
+        return data
+
+    def _fill_gap(self, gap, filled, following):
+        """Fill the latest filled samples of the gap after the written samples.
+        """
+        start = self.samples_written
+
+        if self.gap_fill == 'interpolate' and start > 0 and gap <= self.max_interpolate:
+            dtype = self.data.dtype
+            previous = self.data[:, (start - 1) % self.capacity]
+            weights = np.arange(gap - filled + 1, gap + 1, dtype=dtype) / dtype.type(gap + 1)
+            delta = following.astype(dtype) - previous
+            self._write(start, previous[:, np.newaxis] + delta[:, np.newaxis] * weights)
+            return
+
+        # The NaN is filled in place, the long gap requires no temporary array
+        pos = start % self.capacity
+        first = min(filled, self.capacity - pos)
+        self.data[:, pos:pos+first] = np.nan
+        self.data[:, :filled-first] = np.nan
+
+    def _write(self, start, data):
+        n = data.shape[1]
+        pos = start % self.capacity
+        first = min(n, self.capacity - pos)
+
+        self.data[:, pos:pos+first] = data[:, :first]
+        if first < n:
+            self.data[:, :n-first] = data[:, first:]
+
+    def _read(self, start, n):
+        pos = start % self.capacity
+
+        if pos + n <= self.capacity:
+            view = self.data[:, pos:pos+n]
+            view.flags.writeable = False
+            return view
+
+        return np.concatenate([self.data[:, pos:],
+                               self.data[:, :pos + n - self.capacity]], axis=1)
+
+
+class ColumnRingBuffer(object):
+    '''
+    Fixed-capacity struct-of-arrays ring buffer.
+
+    Every column is the preallocated array of capacity rows,
+    the rows are appended in O(1) and the latest rows are peeked as the column slices,
+    the peeked column is a read-only view if it is not wrapped, otherwise it is the concatenation of the two slices.
+    '''
+
+    def __init__(self, columns, capacity):
+        """Initialize the buffer.
+
+        Args:
+            columns (dict): The columns' names and dtypes;
+            capacity (int): The number of rows.
+        """
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype)
+                        for name, dtype in columns.items()}
+
+        self.rows_written = 0
+        self.lock = Lock()
+
+    def __len__(self):
+        return min(self.rows_written, self.capacity)
+
+    def append(self, **row):
+        """Append the row, the values of all the columns are required.
+        """
+        pos = self.rows_written % self.capacity
+        for name, value in row.items():
+            self.columns[name][pos] = value
+
+        with self.lock:
+            self.rows_written += 1
+
+    def extend(self, **arrays):
+        """Append the rows in batch, the arrays of all the columns are required.
+        If the batch is longer than the capacity, only its latest rows are kept.
+        """
+        length = len(next(iter(arrays.values())))
+        n = min(length, self.capacity)
+
+        # The kept rows are written at the positions of the latest rows
+        pos = (self.rows_written + length - n) % self.capacity
+        first = min(n, self.capacity - pos)
+
+        for name, array in arrays.items():
+            column = self.columns[name]
+            array = np.broadcast_to(array, (n,)) if np.ndim(array) == 0 else array[-n:]
+            column[pos:pos+first] = array[:first]
+            column[:n-first] = array[first:]
+
+        with self.lock:
+            self.rows_written += length
+
+    def peek_latest(self, n, end=None):
+        """Peek the latest n rows.
+
+        Args:
+            n (int): How many rows are required;
+            end (int, optional): The rows are before the end-th written row. Defaults to None, refers all the written rows.
+
+        Returns:
+            dict: The columns of the rows, they are shorter than n if there are not enough rows.
+        """
+        with self.lock:
+            end = self.rows_written if end is None else min(end, self.rows_written)
+            start = max(end - n, self.rows_written - self.capacity, 0)
+
+        return {name: self._read(column, start, end - start)
+                for name, column in self.columns.items()}
+
+    def search(self, name, value):
+        """Search the rows with the sorted column.
+
+        Args:
+            name (str): The column's name, the column is sorted in the written order;
+            value (scalar): The value being searched.
+
+        Returns:
+            int: The number of the written rows not after the value.
+        """
+        with self.lock:
+            n = len(self)
+            rows_written = self.rows_written
+
+        column = self._read(self.columns[name], rows_written - n, n)
+        return rows_written - n + int(np.searchsorted(column, value, side='right'))
+
+    def _read(self, column, start, n):
+        pos = start % self.capacity
+
+        if pos + n <= self.capacity:
+            view = column[pos:pos+n]
+            view.flags.writeable = False
+            return view
+
+        return np.concatenate([column[pos:], column[:pos + n - self.capacity]])
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -24,35 +24,38 @@ import struct
 import serial
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 from threading import Thread
-from datetime import datetime
 
 from . import LOGGER, CONF
-from .toolbox import matplotlib_to_opencv_image, uint8
-
-# Use agg backend to make the fig rendering in the thread
-import seaborn as sns
-import matplotlib
-sns.set_theme()
-matplotlib.use('agg')
+from .toolbox import uint8, put_text, hex2bgr
+from .clock_sync import ClockSync
+from .ring_buffer import ColumnRingBuffer
+from .trace_renderer import SweepRenderer, ColumnEnvelope, ChannelScaler
+from .render_scheduler import RenderScheduler, LatestFrameMailbox
 
 # %% ---- 2023-08-08 ------------------------
 # Function and class
 
 
+# The 21 bytes frame: header, idx, ecg, eda, skt and tail
+frame_struct = struct.Struct('>2xIfff3x')
+frame_dtype = np.dtype([('header', 'u1', (2,)),
+                        ('idx', '>u4'),
+                        ('ecg', '>f4'),
+                        ('eda', '>f4'),
+                        ('skt', '>f4'),
+                        ('tail', 'u1', (3,))])
+
+
 def decode_bytearray(bytearray):
-    a = struct.unpack('>I', bytearray[2:6])
-    b = struct.unpack('>f', bytearray[6:10])
-    c = struct.unpack('>f', bytearray[10:14])
-    d = struct.unpack('>f', bytearray[14:18])
+    a, b, c, d = frame_struct.unpack(bytearray)
 
     return dict(
-        idx=a[0],
-        ecg=b[0],
-        eda=c[0],
-        skt=d[0],
+        idx=a,
+        ecg=b,
+        eda=c,
+        skt=d,
         timestamp=time.time()
     )
 
@@ -67,26 +70,146 @@ def random_package(idx=-1):
     )
 
 
+class Stm32FrameDecoder(object):
+    '''
+    Streaming decoder of the STM32 frames.
+
+    The incoming chunks are appended to the buffer,
+    and the aligned frames are decoded in batch with the frame_dtype.
+    The frame is valid if its header and checksum are correct (if they are given),
+    and its idx follows the previous frame.
+    If the frame is corrupted, the decoder resynchronizes by scanning for two consecutive frames.
+    '''
+    frame_length = frame_dtype.itemsize
+
+    def __init__(self, header=b'', checksum=False):
+        """Initialize the decoder.
+
+        Args:
+            header (bytes, optional): The frame header, it is not checked if empty. Defaults to b''.
+            checksum (bool, optional): Whether the last byte is the sum of the other bytes. Defaults to False.
+        """
+        self.header = np.frombuffer(header, dtype=np.uint8)
+        self.checksum = checksum
+        self.buffer = bytearray()
+        self.locked = False
+        self.last_idx = None
+        self.resyncs = 0
+        self.dropped_bytes = 0
+
+    def feed(self, chunk):
+        """Feed the incoming chunk and decode the frames.
+
+        Args:
+            chunk (bytes): The incoming bytes.
+
+        Returns:
+            np.array: The decoded frames in the frame_dtype.
+        """
+        self.buffer += chunk
+        decoded = []
+
+        while self.locked or self._lock():
+            n = len(self.buffer) // self.frame_length
+            if n == 0:
+                break
+
+            frames = np.frombuffer(self.buffer, dtype=frame_dtype, count=n)
+            valid = self._validate(frames)
+            k = n if valid.all() else int(np.argmin(valid))
+
+            if k > 0:
+                decoded.append(frames[:k].copy())
+                self.last_idx = int(frames['idx'][k-1])
+
+            # Release the view before resizing the buffer
+            del frames
+
+            if k < n:
+                # The frame is corrupted, resynchronize from it
+                del self.buffer[:k * self.frame_length]
+                self.locked = False
+                self.last_idx = None
+                self.resyncs += 1
+                continue
+
+            del self.buffer[:n * self.frame_length]
+            break
+
+        if not decoded:
+            return np.empty(0, dtype=frame_dtype)
+
+        return np.concatenate(decoded)
+
+    def _validate(self, frames):
+        raw = frames.view(np.uint8).reshape(len(frames), self.frame_length)
+        valid = np.ones(len(frames), dtype=bool)
+
+        if len(self.header) > 0:
+            valid &= (raw[:, :len(self.header)] == self.header).all(axis=1)
+
+        if self.checksum:
+            valid &= (raw[:, :-1].sum(axis=1) & 0xFF) == raw[:, -1]
+
+        idx = frames['idx'].astype(np.int64)
+        previous = np.concatenate(
+            [[idx[0] - 1 if self.last_idx is None else self.last_idx], idx[:-1]])
+        valid &= idx == previous + 1
+
+        return valid
+
+    def _lock(self):
+        """Scan for the two consecutive valid frames and drop the bytes before them.
+
+        Returns:
+            bool: Whether the decoder is locked.
+        """
+        L = self.frame_length
+        self.last_idx = None
+
+        for offset in range(len(self.buffer) - 2 * L + 1):
+            frames = np.frombuffer(
+                self.buffer, dtype=frame_dtype, count=2, offset=offset)
+            valid = self._validate(frames).all()
+            del frames
+
+            if valid:
+                del self.buffer[:offset]
+                self.dropped_bytes += offset
+                self.locked = True
+                return True
+
+        # Keep the tail for the next scanning
+        drop = max(len(self.buffer) - (2 * L - 1), 0)
+        del self.buffer[:drop]
+        self.dropped_bytes += drop
+        return False
+
+
 class Stm32DeviceReader(object):
     packages_limit = 5000  # number of packages
     display_window_length = 5  # seconds
     display_pixel_width = 400  # pixels
     display_pixel_height = 400  # pixels
-    display_dpi = 100  # DPI
+    display_fps = 30  # the max frames per second of the panel
+    display_scale = 'minmax'  # 'minmax' or 'percentile', how to scale the channels
     sample_rate = 10  # Hz
     port = 'COM4'  # port name
     baudrate = 115200  # baudrate
+    frame_header = ''  # hex string of the frame header, not checked if empty
+    frame_checksum = False  # whether the last byte of the frame is the checksum
+    serial_timeout = 0.1  # seconds to wait for the incoming bytes
     channels_colors = dict(  # channels and their colors
         ecg='#a00000',
         eda='#00a000',
         skt='#0000a0'
     )
 
-    def __init__(self, video_capture_reader=None):
+    def __init__(self, video_frame_buffer=None):
         self.conf_override()
         self.running = False
         self.simulation_flag = False
-        self.video_capture_reader = video_capture_reader
+        self.video_frame_buffer = video_frame_buffer
 
         LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
 
@@ -113,29 +236,59 @@ class Stm32DeviceReader(object):
     def stop(self):
         self.running = False
 
-    def _read_data(self):
-        self.data_buffer = []
+    def new_data_buffer(self):
+        """Create the struct-of-arrays ring buffer for the packages,
+        the columns are idx, timestamp, aligned_ns and the channels in self.channels_colors.
+        The video_seq column refers the latest frame in the self.video_frame_buffer when the package arrives.
+
+        Returns:
+            ColumnRingBuffer: The empty ring buffer.
+        """
+        columns = dict(idx=np.uint32, timestamp=np.float64, aligned_ns=np.int64)
+        for name in self.channels_colors:
+            columns[name] = np.float32
+
+        if self.video_frame_buffer is not None:
+            columns['video_seq'] = np.int64
+
+        return ColumnRingBuffer(columns, self.packages_limit)
 
+    def _read_data(self):
         LOGGER.debug('Read data loop starts')
 
         try:
-            with serial.Serial(self.port, self.baudrate) as ser:
+            with serial.Serial(self.port, self.baudrate, timeout=self.serial_timeout) as ser:
                 # Not a simulation for the stm32 device,
                 # since I can read from the device
                 self.simulation_flag = False
+                self.frame_decoder = Stm32FrameDecoder(
+                    header=bytes.fromhex(self.frame_header),
+                    checksum=self.frame_checksum)
+
                 while self.running:
-                    incoming = ser.read(21)
-                    package = decode_bytearray(incoming)
+                    # Read all the bytes available, or wait for the first byte
+                    incoming = ser.read(max(ser.in_waiting, 1))
+                    frames = self.frame_decoder.feed(incoming)
 
-                    if self.video_capture_reader is not None:
-                        package['video_bgr'] = self.video_capture_reader.read()
+                    if len(frames) == 0:
+                        continue
 
-                    self.data_buffer.append(package)
+                    # The batch arrives after its last frame is sampled
+                    t = time.time()
+                    self.clock_sync.update(int(frames['idx'][-1]))
+                    aligned_ns = self.clock_sync.to_host_ns(frames['idx'])
 
-                if self.get_data_buffer_size() > self.packages_limit:
-                    LOGGER.warning(
-                        f'Data buffer exceeds {self.packages_limit} packages.')
-                    self.data_buffer.pop(0)
+                    columns = dict(idx=frames['idx'],
+                                   timestamp=t,
+                                   aligned_ns=self._monotonic(aligned_ns))
+                    for name in self.channels_colors:
+                        columns[name] = frames[name]
+
+                    if self.video_frame_buffer is not None:
+                        columns['video_seq'] = self.video_frame_buffer.latest_seq()
+
+                    self.data_buffer.extend(**columns)
+                    self.render_scheduler.notify()
 
         except Exception as err:
             LOGGER.error(f"Serial reading failed, {err}")
@@ -147,104 +300,118 @@ class Stm32DeviceReader(object):
             while self.running:
                 time.sleep(1/self.sample_rate)
                 package = random_package(self.idx)
+                aligned_ns = self.clock_sync.update(package['idx'])
+                package['aligned_ns'] = int(self._monotonic(aligned_ns)[0])
 
-                if self.video_capture_reader is not None:
-                    package['video_bgr'] = self.video_capture_reader.read()
+                if self.video_frame_buffer is not None:
+                    package['video_seq'] = self.video_frame_buffer.latest_seq()
 
-                self.data_buffer.append(package)
+                self.data_buffer.append(**package)
+                self.render_scheduler.notify()
                 self.idx += 1
 
-                if self.get_data_buffer_size() > self.packages_limit:
-                    LOGGER.warning(
-                        f'Data buffer exceeds {self.packages_limit} packages.')
-                    self.data_buffer.pop(0)
-
         LOGGER.debug('Read data loop stops.')
 
-    def _plot_data(self):
-        """Plot the data,
-        it append the mpl fig into self.bgr_list.
-        """
-
-        packages = int(self.display_window_length * self.sample_rate)
-        self.bgr_list = []
+    def _monotonic(self, aligned_ns):
+        """Keep the aligned_ns column not decreasing, since it is searched by peek_data_by_host_time.
+        The model of the clock_sync is refitted at every batch, so the batch may start before the last one ends.
 
-        LOGGER.debug('Plot data starts.')
+        Args:
+            aligned_ns (int or array): The aligned host time of the packages.
 
-        while self.running:
-            fetched = self.peek_latest_data_by_length(packages)
+        Returns:
+            np.array: The aligned host time, not before the last appended one.
+        """
+        aligned_ns = np.maximum.accumulate(
+            np.maximum(np.atleast_1d(aligned_ns), self.last_aligned_ns))
+        self.last_aligned_ns = int(aligned_ns[-1])
+        return aligned_ns
 
-            if fetched is None:
-                continue
+    def new_trace_renderer(self):
+        """Create the renderer for the channels' traces.
 
-            timestamp = fetched[-1]['timestamp']
+        Returns:
+            SweepRenderer: The renderer of the display size.
+        """
+        return SweepRenderer(width=self.display_pixel_width,
+                             height=self.display_pixel_height,
+                             window_length=self.display_window_length,
+                             y_range=(-0.2, len(self.channels_colors) + 0.2),
+                             colors=[hex2bgr(color) for color in self.channels_colors.values()])
 
-            fig, axe = plt.subplots(1, 1, figsize=(
-                self.display_pixel_width/self.display_dpi, self.display_pixel_height/self.display_dpi), dpi=self.display_dpi)
+    def new_envelope(self):
+        """Create the min and max envelopes of the channels per pixel column of the window.
 
-            latest_package_idx = fetched[-1]['idx'] % packages
+        Returns:
+            ColumnEnvelope: The empty envelopes.
+        """
+        return ColumnEnvelope(channels=len(self.channels_colors),
+                              width=self.display_pixel_width,
+                              window_samples=int(self.display_window_length * self.sample_rate))
 
-            # Draw the left part of the signal
-            select = [e for e in fetched
-                      if e['idx'] % packages < latest_package_idx]
-            n = len(select)
-            if n > 0:
-                t = np.linspace(0, n/self.sample_rate, n, endpoint=False)
-                for name, color in self.channels_colors.items():
-                    array = [e[name] for e in select]
+    def _plot_data(self):
+        """Plot the data in the sweep mode,
+        it decimates and draws the packages arriving since the last frame, and puts the panel into self.mailbox.
+        """
 
-                    # re scale array by name
-                    # array = array * k + b
+        renderer = self.new_trace_renderer()
+        envelope = self.new_envelope()
+        scaler = ChannelScaler(method=self.display_scale)
 
-                    axe.plot(t, array, label=name, color=color)
+        LOGGER.debug('Plot data starts.')
 
-                axe.legend()
+        while self.running:
+            # Wake up when the new package arrives,
+            # the timeout is to check the self.running.
+            if not self.render_scheduler.wait(timeout=2 / self.sample_rate):
+                continue
 
-            # Draw the right part of the signal
-            select = [e for e in fetched
-                      if e['idx'] % packages > latest_package_idx]
-            m = len(select)
-            if m > 0:
-                t = np.linspace(self.display_window_length - m/self.sample_rate,
-                                self.display_window_length, m, endpoint=False)
-                for name, color in self.channels_colors.items():
-                    array = [e[name] for e in select]
+            # Draw the latest window at the first frame
+            end = self.data_buffer.rows_written
+            if envelope.written is None:
+                since = max(end - envelope.window_samples, 0)
+            else:
+                since = envelope.written
 
-                    # re scale array by name
-                    # array = array * k + b
+            fetched = self.data_buffer.peek_latest(end - since, end)
+            start = end - len(fetched['idx'])
+            if start == end:
+                continue
 
-                    axe.plot(t, array, linewidth=0.5, label=name, color=color)
+            timestamp = fetched['timestamp'][-1]
 
-                if n == 0:
-                    axe.legend()
+            # Decimate the packages into the columns
+            columns = envelope.update(np.array([fetched[k] for k in self.channels_colors]), start)
 
-            # Setup axe
-            axe.set_xlim(0, self.display_window_length)
+            # The channels are scaled by the latest window
+            d = scaler(envelope.points(columns),
+                       reference=envelope.window_points())
 
-            axe.set_title(
-                f'Stm32 ({self.port}) {self.get_data_buffer_size()} | {self.packages_limit}')
+            renderer.update(d, columns)
 
+            # The canvas is kept by the renderer
+            title = f'Stm32 ({self.port}) {self.get_data_buffer_size()} | {self.packages_limit}'
             if self.simulation_flag:
-                axe.set_title(
-                    f'Stm32 (Simulation) {self.get_data_buffer_size()} | {self.packages_limit}')
+                title = f'Stm32 (Simulation) {self.get_data_buffer_size()} | {self.packages_limit}'
+            bgr = renderer.snapshot(title)
 
-            # Convert the bgr into the opencv-image
-            fig.tight_layout()
-            bgr = matplotlib_to_opencv_image(fig)
+            # The legend of the channels, the channel j is drawn around j from the bottom
+            n = len(self.channels_colors)
+            for j, (name, color) in enumerate(self.channels_colors.items()):
+                put_text(bgr, name, org=(self.display_pixel_width - 50, 20 + (n - 1 - j) * 20),
+                         fontScale=0.5, color=hex2bgr(color))
 
-            self.bgr_list.append((timestamp, bgr))
-
-            continue
+            self.mailbox.put(timestamp, bgr)
 
         LOGGER.debug('Plot data stops.')
 
     def read_bgr(self):
-        if len(self.bgr_list) < 1:
-            return None
+        """Read the latest rendered panel.
 
-        timestamp, bgr = self.bgr_list.pop(0)
-
-        return timestamp, bgr
+        Returns:
+            tuple: The (timestamp, bgr) of the panel, None if there is no new panel.
+        """
+        return self.mailbox.take()
 
     def get_data_buffer_size(self):
         """Get the current buffer size for the data_buffer
@@ -254,16 +421,17 @@ class Stm32DeviceReader(object):
         """
         return len(self.data_buffer)
 
-    def peek_latest_data_by_length(self, length=50):
+    def peek_latest_data_by_length(self, length=50, end=None):
         """Peek the latest data in the self.data_buffer with given length.
 
         If there is no data available, return None.
 
         Args:
-            length (int, optional): How many packages are required, the length in seconds are length x self.package_interval. Defaults to 50.
+            length (int, optional): How many packages are required, the length in seconds are length / self.sample_rate. Defaults to 50.
+            end (int, optional): The packages are before the end-th written package. Defaults to None, refers all the packages.
 
         Returns:
-            list: The data being fetched. The elements of the list are (idx, timestamp, data of (self.channels x self.package_length)).
+            dict: The data being fetched. The keys are the columns of the self.data_buffer, the values are the arrays of the packages.
             None if there is no data available.
         """
         n = self.get_data_buffer_size()
@@ -275,32 +443,62 @@ class Stm32DeviceReader(object):
         if n < length:
             LOGGER.warning(f'Can not peek data with {length} samples.')
 
-        return list(self.data_buffer[-length:].copy())
+        return self.data_buffer.peek_latest(length, end)
 
-    def peek_latest_data_by_milliseconds(self, milliseconds=1000):
+    def peek_latest_data_by_milliseconds(self, milliseconds=1000, end_ns=None):
         """Peek the latest data available for given milliseconds.
 
         Args:
             milliseconds (int, optional): The milliseconds being required. Defaults to 1000.
+            end_ns (int, optional): The aligned host time of the window's end, see ClockSync. Defaults to None, refers the latest package.
 
         Returns:
             np.array: The (3 x n) array, the n refers the samples and the 3 refers the channels, the order is given in self.channels_colors.
+            None if the packages at end_ns have not arrived.
         """
         length = int(milliseconds / 1000 * self.sample_rate)
 
-        array = self.peek_latest_data_by_length(length)
+        if end_ns is None:
+            fetched = self.peek_latest_data_by_length(length)
+        else:
+            fetched = self.peek_data_by_host_time(end_ns, length)
+            if fetched is None:
+                return None
 
-        if array is None:
+        if fetched is None:
             LOGGER.error(
                 f'Failed peek_latest_data_by_length with {milliseconds}')
             return None
 
-        return np.array([[e[k] for k in self.channels_colors] for e in array]).transpose()
+        return np.array([fetched[k] for k in self.channels_colors])
+
+    def peek_data_by_host_time(self, end_ns, length):
+        """Peek the packages ending at the aligned host time.
+
+        Args:
+            end_ns (int): The aligned host time of the last package;
+            length (int): How many packages are required.
+
+        Returns:
+            dict: The packages not after the end_ns, None if the package after the end_ns has not arrived.
+        """
+        end = self.data_buffer.search('aligned_ns', end_ns)
+
+        # The package after the end_ns has not arrived
+        if end >= self.data_buffer.rows_written:
+            return None
+
+        return self.data_buffer.peek_latest(length, end)
 
     def run_forever(self):
         """Run the loops forever.
         """
         self.running = True
+        self.data_buffer = self.new_data_buffer()
+        self.render_scheduler = RenderScheduler(self.display_fps)
+        self.mailbox = LatestFrameMailbox()
+        self.clock_sync = ClockSync(self.sample_rate, name='Stm32')
+        self.last_aligned_ns = 0
         Thread(target=self._read_data, daemon=True).start()
         Thread(target=self._plot_data, daemon=True).start()
         return
@@ -22,7 +22,6 @@ Functions:
 import cv2
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 # %%
 
@@ -50,6 +49,19 @@ def uint8(x):
     return x.astype(np.uint8)
 
 
+def hex2bgr(color):
+    """Convert the hex color into the bgr color
+
+    Args:
+        color (str): The hex color, like '#a00000'.
+
+    Returns:
+        tuple: The bgr color, like (0, 0, 160).
+    """
+    color = color.lstrip('#')
+    return tuple(int(color[j:j+2], 16) for j in (4, 2, 0))
+
+
 def put_text(bgr, text, **input_kwargs):
     """Put text into the opencv image
 
@@ -70,29 +82,6 @@ def put_text(bgr, text, **input_kwargs):
     return bgr
 
 
-def matplotlib_to_opencv_image(fig):
-    """Convert matplotlib fig to opencv image format
-
-    Args:
-        fig (mpl.Figure): The input fig.
-
-    Returns:
-        Opencv BGR image: The output image.
-    """
-    # Render the plot to a buffer
-    fig.canvas.draw()
-    buf = fig.canvas.tostring_rgb()
-    ncols, nrows = fig.canvas.get_width_height()
-    plt.close(fig)  # Close the figure to prevent displaying it
-
-    # Convert the buffer to a numpy array
-    arr = np.frombuffer(buf, dtype=np.uint8)
-    arr = arr.reshape(nrows, ncols, 3)
-
-    # Convert RGB to BGR
-    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-
-
 def timestamp2milliseconds(t):
     """Convert timestamp into milliseconds.
 
@@ -0,0 +1,426 @@
+"""
+File: trace_renderer.py
+Author: Chuncheng Zhang
+Date: 2026-10-18
+Copyright & Email: chuncheng.zhang@ia.ac.cn
+
+Purpose:
+    Draw the channel traces into the opencv image
+
+Functions:
+    1. Requirements and constants
+    2. Function and class
+    3. Play ground
+    4. Pending
+    5. Pending
+"""
+
+
+# %% ---- 2026-10-18 ------------------------
+# Requirements and constants
+import cv2
+import warnings
+
+import numpy as np
+
+from .toolbox import put_text
+
+# The bgr colors of the channels, they are used in cycle
+default_colors = [
+    (180, 119, 31),
+    (14, 127, 255),
+    (44, 160, 44),
+    (40, 39, 214),
+    (189, 103, 148),
+    (75, 86, 140),
+    (194, 119, 227),
+    (127, 127, 127),
+    (34, 189, 188),
+    (207, 190, 23),
+]
+
+
+# %% ---- 2026-10-18 ------------------------
+# Function and class
+
+
+class TraceRenderer(object):
+    '''
+    Draw the channel traces into the preallocated bgr canvas with cv2.polylines.
+
+    The x-axis is the time of the window, from 0 to the window_length in seconds,
+    the y-axis is the value range, the channel j is usually drawn around j.
+
+    The values are mapped into the pixels in the vectorized manner,
+    the samples are decimated into the pixel columns beforehand, see ColumnEnvelope.
+    '''
+
+    def __init__(self, width, height, window_length, y_range, colors=None, background=(255, 255, 255)):
+        """Initialize the renderer.
+
+        Args:
+            width (int): The width of the canvas in pixels;
+            height (int): The height of the canvas in pixels;
+            window_length (float): The length of the x-axis in seconds;
+            y_range (tuple): The (min, max) values of the y-axis;
+            colors (list, optional): The bgr colors of the channels. Defaults to None, refers default_colors;
+            background (tuple, optional): The bgr color of the background. Defaults to (255, 255, 255).
+        """
+        self.width = width
+        self.height = height
+        self.window_length = window_length
+        self.y_range = y_range
+        self.colors = colors or default_colors
+        self.background = background
+
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.clear()
+
+    def clear(self):
+        """Clear the canvas with the background.
+        """
+        self.canvas[:] = self.background
+        return self.canvas
+
+    def to_points(self, x, y):
+        """Map the values into the pixel rows, and pair them with the pixel columns.
+
+        Args:
+            x (1d array): The pixel columns of the points;
+            y (2d array): The values of the points, the shape is (channels x points).
+
+        Returns:
+            3d array: The int32 points of the shape (channels x points x 2), the last dimension is (x, y).
+        """
+        y_min, y_max = self.y_range
+        y = (y_max - y) / (y_max - y_min) * (self.height - 1)
+
+        # The NaN is drawn at the bottom
+        y = np.clip(np.nan_to_num(y, nan=self.height - 1),
+                    0, self.height - 1).astype(np.int32)
+
+        points = np.empty((y.shape[0], y.shape[1], 2), dtype=np.int32)
+        points[:, :, 0] = x
+        points[:, :, 1] = y
+        return points
+
+    def draw_points(self, points, thickness=1):
+        """Draw the polylines of the channels.
+
+        Args:
+            points (3d array): The points of the shape (channels x points x 2), see to_points;
+            thickness (int, optional): The thickness of the lines. Defaults to 1.
+
+        Returns:
+            np.array: The canvas.
+        """
+        for j, pts in enumerate(points):
+            color = self.colors[j % len(self.colors)]
+            cv2.polylines(self.canvas, [pts], False, color, thickness)
+
+        return self.canvas
+
+    def put_title(self, text, bgr=None):
+        """Put the title on the bottom of the canvas.
+
+        Args:
+            text (str): The title;
+            bgr (np.array, optional): The image being put. Defaults to None, refers the canvas.
+
+        Returns:
+            np.array: The image.
+        """
+        bgr = self.canvas if bgr is None else bgr
+        return put_text(bgr, text, org=(10, self.height - 8), fontScale=0.4, color=(0, 0, 0))
+
+
+class ColumnEnvelope(object):
+    '''
+    Min and max envelopes of the channels per pixel column of the sweep window.
+
+    The sample at the position p of the written samples belongs to the pixel column of its phase (p % window_samples),
+    the envelopes are updated by the incoming samples only,
+    the column is restarted when the sweep enters it, and it is merged with the following samples in it.
+    So the window of any length is decimated into 2 points per pixel column per channel,
+    and the scale of the window is computed from the envelopes.
+    '''
+
+    def __init__(self, channels, width, window_samples):
+        """Initialize the envelopes.
+
+        Args:
+            channels (int): The number of channels;
+            width (int): The number of pixel columns;
+            window_samples (int): The number of samples in the window.
+        """
+        self.channels = channels
+        self.width = width
+        self.window_samples = max(window_samples, 1)
+
+        self.low = np.full((channels, width), np.nan, dtype=np.float32)
+        self.high = np.full((channels, width), np.nan, dtype=np.float32)
+
+        # The position of the next sample, and the column of the last sample
+        self.written = None
+        self.last_column = None
+
+    def to_columns(self, positions):
+        """The pixel columns of the positions in the written samples.
+        """
+        phase = positions % self.window_samples
+        return np.round(phase * (self.width - 1) / self.window_samples).astype(np.int64)
+
+    def update(self, data, start):
+        """Update the envelopes with the incoming samples.
+
+        Args:
+            data (2d array): The samples, the shape is (channels x n);
+            start (int): The position of the first sample in the written samples.
+
+        Returns:
+            1d array: The updated columns in the sweep order, they decrease where the sweep wraps.
+        """
+        n = data.shape[1]
+        if n < 1:
+            return np.zeros(0, dtype=np.int64)
+
+        # Only the latest sweep is kept
+        if n > self.window_samples:
+            start += n - self.window_samples
+            data = data[:, -self.window_samples:]
+            n = self.window_samples
+
+        continuing = self.written == start
+
+        columns = self.to_columns(start + np.arange(n))
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(columns)) + 1])
+
+        # The NaN is ignored if possible
+        low = np.fmin.reduceat(data, starts, axis=1)
+        high = np.fmax.reduceat(data, starts, axis=1)
+        columns = columns[starts]
+
+        # Merge with the samples already in the column
+        if continuing and columns[0] == self.last_column:
+            low[:, 0] = np.fmin(low[:, 0], self.low[:, columns[0]])
+            high[:, 0] = np.fmax(high[:, 0], self.high[:, columns[0]])
+
+        self.low[:, columns] = low
+        self.high[:, columns] = high
+
+        self.written = start + n
+        self.last_column = columns[-1]
+        return columns
+
+    def points(self, columns):
+        """The envelope points of the columns.
+
+        Args:
+            columns (1d array): The columns.
+
+        Returns:
+            2d array: The (channels x 2n) array, the min and max of every column are interleaved.
+        """
+        return np.stack([self.low[:, columns], self.high[:, columns]], axis=2).reshape(self.channels, -1)
+
+    def window_points(self):
+        """The envelope points of all the columns of the window.
+
+        Returns:
+            2d array: The (channels x 2width) array, see points, the columns not written are NaN.
+        """
+        return self.points(np.arange(self.width))
+
+
+class ChannelScaler(object):
+    '''
+    Scale the channels for the display, the channel j is scaled into [j, j+1].
+
+    The low and high of the channels are computed along the time axis of the reference in one pass,
+    by the min and max ('minmax') or by the percentiles ('percentile'),
+    and they are smoothed across the frames, so the traces do not jump every frame.
+    '''
+
+    def __init__(self, method='minmax', percentiles=(1, 99), smoothing=0.9):
+        """Initialize the scaler.
+
+        Args:
+            method (str, optional): 'minmax' or 'percentile', how to compute the low and high. Defaults to 'minmax';
+            percentiles (tuple, optional): The percentiles of the low and high for the 'percentile' method. Defaults to (1, 99);
+            smoothing (float, optional): The weight of the previous low and high. Defaults to 0.9.
+        """
+        self.method = method
+        self.percentiles = percentiles
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self.low = None
+        self.high = None
+
+    def fit(self, reference):
+        """Update the low and high with the reference.
+
+        Args:
+            reference (2d array): The reference of the shape (channels x times), the NaN is ignored.
+
+        Returns:
+            ChannelScaler: The scaler itself.
+        """
+        reference = np.asarray(reference, dtype=np.float32)
+
+        if self.method == 'percentile':
+            # The NaN is replaced by the median to keep the percentiles in one pass,
+            # the channels without valid samples are NaN
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                median = np.nanmedian(reference, axis=1, keepdims=True)
+            reference = np.where(np.isnan(reference), median, reference)
+            low, high = np.percentile(reference, self.percentiles, axis=1)
+        else:
+            low = np.fmin.reduce(reference, axis=1)
+            high = np.fmax.reduce(reference, axis=1)
+
+        if self.low is None or self.low.shape != low.shape:
+            self.low, self.high = low, high
+            return self
+
+        # The channels without valid samples keep their previous low and high
+        a = self.smoothing
+        self.low = np.where(np.isnan(low), self.low, a * self.low + (1 - a) * low)
+        self.high = np.where(np.isnan(high), self.high, a * self.high + (1 - a) * high)
+
+        # The first valid low and high are used directly
+        self.low = np.where(np.isnan(self.low), low, self.low)
+        self.high = np.where(np.isnan(self.high), high, self.high)
+        return self
+
+    def transform(self, data):
+        """Scale the data with the low and high.
+
+        Args:
+            data (2d array): The data of the shape (channels x times).
+
+        Returns:
+            2d array: The new array of the scaled data.
+        """
+        span = self.high - self.low
+        span = np.where(np.isfinite(span) & (span > 0), span, 1)
+
+        offset = np.arange(len(span)) - np.nan_to_num(self.low) / span
+        return data / span[:, np.newaxis] + offset[:, np.newaxis]
+
+    def __call__(self, data, reference=None):
+        """Fit with the reference and scale the data.
+
+        Args:
+            data (2d array): The data of the shape (channels x times);
+            reference (2d array, optional): The reference. Defaults to None, refers the data.
+
+        Returns:
+            2d array: The new array of the scaled data.
+        """
+        self.fit(data if reference is None else reference)
+        return self.transform(data)
+
+
+class SweepRenderer(TraceRenderer):
+    '''
+    Draw the channel traces in the sweep mode incrementally.
+
+    The canvas is kept between the frames,
+    only the envelope columns updated since the last frame are drawn, see ColumnEnvelope,
+    and the erase bar ahead of them clears the traces of the previous sweep.
+    The cost of the frame scales with the incoming samples rather than the window length.
+    '''
+
+    def __init__(self, width, height, window_length, y_range, erase_width=10, **kwargs):
+        """Initialize the renderer.
+
+        Args:
+            erase_width (int, optional): The width of the erase bar in pixels. Defaults to 10;
+            The other args are the same as the TraceRenderer.
+        """
+        super().__init__(width, height, window_length, y_range, **kwargs)
+        self.erase_width = erase_width
+        self.reset()
+
+    def reset(self):
+        """Clear the canvas and restart the sweep.
+        """
+        self.clear()
+
+        # The last drawn point and its column
+        self.last = None
+        self.last_column = None
+
+    def update(self, data, columns):
+        """Draw the updated columns.
+
+        Args:
+            data (2d array): The envelope points of the columns, the shape is (channels x 2n), see ColumnEnvelope.points;
+            columns (1d array): The n columns in the sweep order.
+
+        Returns:
+            np.array: The canvas.
+        """
+        if len(columns) < 1:
+            return self.canvas
+
+        # The sweep restarts from the left where the columns wrap
+        breaks = np.flatnonzero(np.diff(columns) < 0) + 1
+
+        for segment in np.split(np.arange(len(columns)), breaks):
+            select = (segment[:, np.newaxis] * 2 + [0, 1]).ravel()
+            self._draw_columns(data[:, select], columns[segment])
+
+        return self.canvas
+
+    def snapshot(self, title=None):
+        """The copy of the canvas, the title is put on the copy.
+
+        Args:
+            title (str, optional): The title. Defaults to None.
+
+        Returns:
+            np.array: The image.
+        """
+        bgr = self.canvas.copy()
+        if title is not None:
+            self.put_title(title, bgr)
+        return bgr
+
+    def _draw_columns(self, data, columns):
+        x = np.repeat(columns, 2)
+        first = columns[0]
+
+        if self.last is not None and columns[0] >= self.last_column:
+            # Connect to the last drawn point, the drawn columns are kept
+            data = np.concatenate([self.last[:, np.newaxis], data], axis=1)
+            x = np.concatenate([[self.last_column], x])
+            first = self.last_column + 1
+
+        self.last = np.array(data[:, -1])
+        self.last_column = columns[-1]
+
+        self._erase(first, columns[-1] + self.erase_width)
+        self.draw_points(self.to_points(x, data))
+
+    def _erase(self, first, last):
+        """Erase the columns from first to last, the columns out of the right edge are wrapped.
+        """
+        self.canvas[:, first:min(last, self.width - 1) + 1] = self.background
+        if last >= self.width:
+            self.canvas[:, :last - self.width + 1] = self.background
+
+
+# %% ---- 2026-10-18 ------------------------
+# Play ground
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
+
+
+# %% ---- 2026-10-18 ------------------------
+# Pending
@@ -19,27 +19,75 @@ Functions:
 # %% ---- 2023-07-24 ------------------------
 # Requirements and constants
 import cv2
+import time
 
 import numpy as np
 
+from threading import Thread, Lock
+
 from . import LOGGER, CONF
 from .toolbox import uint8
+from .clock_sync import now_ns
+from .ring_buffer import ColumnRingBuffer
 
 
 # %% ---- 2023-07-24 ------------------------
 # Function and class
+def edge_stage(bgr):
+    """Draw the edges of the frame into the green and red channels.
+
+    Args:
+        bgr (np.array): The frame, it is changed in place.
+
+    Returns:
+        np.array: The frame.
+    """
+    bgr[:, :, 0] = 0
+    # markers = cv2.watershed(bgr, markers)
+
+    bgr[:, :, 1] = cv2.Canny(bgr, 100, 50)
+    bgr[:, :, 2] = cv2.Canny(bgr, 50, 100)
+
+    # bgr = cv2.cvtColor(cv2.Canny(bgr, 50, 100), cv2.COLOR_GRAY2BGR)
+
+    return bgr
 
 
 # %% ---- 2023-07-24 ------------------------
 # Play ground
 class VideoCaptureReader(object):
+    '''
+    Read the frames of the video capture.
+
+    The frames are grabbed continuously in the background thread,
+    only the latest frame is kept with its seq and capture time,
+    so the reading is the non-blocking lookup of the latest frame and it is safe in the threads.
+
+    There are two paths of the frame:
+    the raw path serves the untouched frame,
+    the display path resizes the frame and applies the stages in self.stages in order,
+    it is computed lazily once per frame, and cached by the seq of the frame.
+    '''
     video_capture_idx = 0  # cv2.VideoCapture(#)
     display_width = 400  # px
     display_height = 300  # px
+    retry_interval = 0.1  # seconds to wait after the grabbing fails
 
     def __init__(self):
         self.conf_override()
         self.vid = None
+        self.running = False
+
+        # The latest frame, its seq and host time of the capture, see ClockSync
+        self.lock = Lock()
+        self.seq = -1
+        self.timestamp_ns = None
+        self.bgr_raw = None
+
+        # The stages of the display path, every stage is the function of bgr -> bgr
+        self.stages = [edge_stage]
+        self.display_cache = (None, None)
+
         self.connect()
 
         LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
@@ -54,31 +102,272 @@ class VideoCaptureReader(object):
 
     @LOGGER.catch
     def connect(self):
-        self.vid = cv2.VideoCapture(0)
+        self.vid = cv2.VideoCapture(self.video_capture_idx)
         LOGGER.debug('Connected to video capture')
 
+    def start(self):
+        if not self.running:
+            self.run_forever()
+        else:
+            LOGGER.error('Can not start, since it is already running')
+
+    def stop(self):
+        self.running = False
+
+    def _grab_frames(self):
+        LOGGER.debug('Grab frames loop starts.')
+
+        while self.running:
+            # The grab() waits for the next frame of the camera
+            success_flag = self.vid is not None and self.vid.grab()
+            timestamp_ns = now_ns()
+
+            if success_flag:
+                success_flag, bgr = self.vid.retrieve()
+
+            if not success_flag:
+                # LOGGER.error('Receives frame fails')
+                time.sleep(self.retry_interval)
+                continue
+
+            # The raw frame is shared by the readers
+            bgr.flags.writeable = False
+
+            with self.lock:
+                self.seq += 1
+                self.timestamp_ns = timestamp_ns
+                self.bgr_raw = bgr
+
+        if self.vid is not None:
+            self.vid.release()
+
+        LOGGER.debug('Grab frames loop stops.')
+
+    def set_stages(self, stages):
+        """Set the stages of the display path.
+
+        Args:
+            stages (list): The functions of bgr -> bgr, they are applied in order after resizing.
+        """
+        self.stages = list(stages)
+        self.display_cache = (None, None)
+
+    def placeholder_image(self):
+        bgr = uint8(np.random.randint(
+            50, 200, (self.display_height, self.display_width, 3)))
+        bgr[:40] = 0
+        return bgr
+
+    def read_raw_frame(self):
+        """Read the latest untouched frame, it does not wait for the camera.
+
+        Returns:
+            tuple: The (seq, timestamp_ns, bgr) of the latest frame, the bgr is read-only;
+            the seq is -1 and the bgr is the placeholder if there is no frame.
+        """
+        with self.lock:
+            seq, timestamp_ns, bgr = self.seq, self.timestamp_ns, self.bgr_raw
+
+        if bgr is None:
+            return seq, now_ns(), self.placeholder_image()
+
+        return seq, timestamp_ns, bgr
+
+    def read_display_frame(self):
+        """Read the latest frame of the display path, it does not wait for the camera.
+
+        Returns:
+            tuple: The (seq, timestamp_ns, bgr) of the latest frame, the bgr is the copy being safe to draw on;
+            the seq is -1 and the bgr is the placeholder if there is no frame.
+        """
+        seq, timestamp_ns, bgr = self.read_raw_frame()
+
+        if seq == -1:
+            return seq, timestamp_ns, bgr
+
+        key = (seq, self.display_width, self.display_height)
+        cached_key, cached_bgr = self.display_cache
+
+        if cached_key != key:
+            # Resize before the stages, they run on the display size
+            cached_bgr = cv2.resize(bgr, (self.display_width, self.display_height))
+            for stage in self.stages:
+                cached_bgr = stage(cached_bgr)
+            self.display_cache = (key, cached_bgr)
+
+        return seq, timestamp_ns, cached_bgr.copy()
+
+    def read_raw(self):
+        """Read the latest untouched frame.
+
+        Returns:
+            np.array: The read-only bgr of the latest frame.
+        """
+        return self.read_raw_frame()[2]
+
+    def read_display(self):
+        """Read the latest frame of the display path.
+
+        Returns:
+            np.array: The bgr of the latest frame.
+        """
+        return self.read_display_frame()[2]
+
     def read(self):
-        success_flag, bgr = self.vid.read()
+        return self.read_display()
+
+    def run_forever(self):
+        """Run the loops forever.
+        """
+        self.running = True
+        Thread(target=self._grab_frames, daemon=True).start()
+        return
+
+
+class VideoFrameBuffer(object):
+    '''
+    Timestamped ring buffer of the video frames.
+
+    The frames are recorded from the video_capture_reader in its own thread at record_fps,
+    and at most frame_budget frames are kept in the preallocated array,
+    so the other readers refer the frames by their seq or timestamp.
+    '''
+    frame_budget = 100  # number of frames being kept
+    record_fps = 10  # frames per second being recorded
+
+    def __init__(self, video_capture_reader):
+        self.conf_override()
+        self.video_capture_reader = video_capture_reader
+        self.running = False
+        self.data_buffer = None
+
+        LOGGER.debug(f'Initialize {self.__class__} with {self.__dict__}')
+
+    def conf_override(self):
+        for key, value in CONF['video_buffer'].items():
+            if not (hasattr(self, key)):
+                LOGGER.warning(f'Invalid key: {key} in CONF')
+                continue
+            setattr(self, key, value)
+
+        LOGGER.debug('Override the options with CONF')
+
+    def start(self):
+        if not self.running:
+            self.run_forever()
+        else:
+            LOGGER.error('Can not start, since it is already running')
+
+    def stop(self):
+        self.running = False
+
+    def new_data_buffer(self, shape):
+        """Create the ring buffer for the frames of the shape.
+
+        Args:
+            shape (tuple): The shape of the frame.
+
+        Returns:
+            ColumnRingBuffer: The empty ring buffer, the columns are seq, timestamp_ns and bgr.
+        """
+        columns = dict(seq=np.int64,
+                       timestamp_ns=np.int64,
+                       bgr=np.dtype((np.uint8, shape)))
+
+        LOGGER.debug(
+            f'Allocate {self.frame_budget} frames of {shape} for the video buffer')
+        return ColumnRingBuffer(columns, self.frame_budget)
+
+    def _record_data(self):
+        LOGGER.debug('Record frames loop starts.')
+
+        interval = 1 / self.record_fps
+        seq = 0
+        video_seq = -1
+
+        while self.running:
+            tic = time.time()
+
+            latest_seq, timestamp_ns, bgr = self.video_capture_reader.read_display_frame()
+
+            # The frame has been recorded
+            if latest_seq != -1 and latest_seq == video_seq:
+                time.sleep(max(interval - (time.time() - tic), 0))
+                continue
+            video_seq = latest_seq
+
+            if self.data_buffer is None:
+                self.data_buffer = self.new_data_buffer(bgr.shape)
+
+            # The display size may change, the frames are kept in the same shape
+            shape = self.data_buffer.columns['bgr'].shape[1:]
+            if bgr.shape != shape:
+                bgr = cv2.resize(bgr, (shape[1], shape[0]))
+
+            self.data_buffer.append(seq=seq, timestamp_ns=timestamp_ns, bgr=bgr)
+            seq += 1
+
+            time.sleep(max(interval - (time.time() - tic), 0))
+
+        LOGGER.debug('Record frames loop stops.')
+
+    def latest_seq(self):
+        """The seq of the latest frame.
+
+        Returns:
+            int: The seq, -1 if there is no frame.
+        """
+        if self.data_buffer is None:
+            return -1
+        return self.data_buffer.rows_written - 1
+
+    def get_frame(self, seq):
+        """Get the frame by the seq.
+
+        Args:
+            seq (int): The seq of the frame.
+
+        Returns:
+            tuple: The (timestamp_ns, bgr) of the frame, None if the frame is not kept.
+        """
+        if seq < 0 or seq > self.latest_seq() or seq <= self.latest_seq() - len(self.data_buffer):
+            return None
+
+        fetched = self.data_buffer.peek_latest(1, end=seq + 1)
+        return fetched['timestamp_ns'][0], fetched['bgr'][0]
+
+    def get_frame_by_host_time(self, host_ns):
+        """Get the latest frame not after the host time.
 
-        if not success_flag:
-            # LOGGER.error('Receives frame fails')
-            bgr = uint8(np.random.randint(
-                50, 200, (self.display_height, self.display_width, 3)))
-            bgr[:40] = 0
-            return bgr
+        Args:
+            host_ns (int): The host time, see ClockSync.
 
-        bgr_raw = bgr.copy()
+        Returns:
+            tuple: The (timestamp_ns, bgr) of the frame, None if the frame is not kept.
+        """
+        if self.data_buffer is None:
+            return None
+        return self.get_frame(self.data_buffer.search('timestamp_ns', host_ns) - 1)
 
-        bgr[:, :, 0] = 0
-        # markers = bgr_raw
-        # markers = cv2.watershed(bgr, markers)
+    def peek_latest_data_by_length(self, length=50):
+        """Peek the latest frames.
 
-        bgr[:, :, 1] = cv2.Canny(bgr, 100, 50)
-        bgr[:, :, 2] = cv2.Canny(bgr, 50, 100)
+        Args:
+            length (int, optional): How many frames are required. Defaults to 50.
 
-        # bgr = cv2.cvtColor(cv2.Canny(bgr, 50, 100), cv2.COLOR_GRAY2BGR)
+        Returns:
+            dict: The seq, timestamp_ns and bgr arrays of the frames, None if there is no frame.
+        """
+        if self.data_buffer is None:
+            return None
+        return self.data_buffer.peek_latest(length)
 
-        return cv2.resize(bgr, (self.display_width, self.display_height))
+    def run_forever(self):
+        """Run the loops forever.
+        """
+        self.running = True
+        Thread(target=self._record_data, daemon=True).start()
+        return
 
 
 # %% ---- 2023-07-24 ------------------------